@@ -51,7 +51,7 @@ class MyGame(arcade.Window):
         # Note: If the enemy sprites are the same size, we only need to calculate
         # one of these. We do NOT need a different one for each enemy. The sprite
         # is just used for a size calculation.
-        self.Map = LayeredBarrierDict([], 64, 0, SCREEN_WIDTH, 0, SCREEN_HEIGHT, base = "dirt")
+        self.Map = LayeredBarrierDict(64, 0, SCREEN_WIDTH, 0, SCREEN_HEIGHT, base = 0)
 
         # Set up the player
         resource = ":resources:images/animated_characters/" \
@@ -80,12 +80,12 @@ class MyGame(arcade.Window):
                 sprite.center_y = y
                 if random.random() < .3: #30% chance of wall
                     self.wall_list.append(sprite)
-                    self.Map[sprite.center_x/64][sprite.center_y/64] = 1
+                    self.Map.push_layer(sprite.center_x/64, sprite.center_y/64, 1)
         #player
-        self.Map[2][2] = 0
+        self.Map.set_layers(2, 2, [0])
 
         #enemy
-        self.Map[10][5] = 0
+        self.Map.set_layers(10, 5, [0])
 
     def on_draw(self):
         """
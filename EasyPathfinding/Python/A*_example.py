@@ -7,7 +7,7 @@ python -m EasyPathfinding.A*_example
 import arcade
 import random
 
-from pathfinding import AStarSearch
+from task import AStarTask
 from customMaps import LivingMap
 
 
@@ -47,6 +47,7 @@ class MyGame(arcade.Window):
         # This variable holds the travel-path. We keep it as an attribute so
         # we can calculate it in on_update, and draw it in on_draw.
         self.path = None
+        self.search = None
 
         # Note: If the enemy sprites are the same size, we only need to calculate
         # one of these. We do NOT need a different one for each enemy. The sprite
@@ -136,8 +137,13 @@ class MyGame(arcade.Window):
             #revert move
             player.center_y -= change_y
 
+        # Spread the search over frames, at most 2ms of pathfinding per frame
         # NOTE: diagonal movement might cause the enemy to clip corners.
-        self.path = AStarSearch(self.Map, self.player.position, self.enemy.position, allow_diagonal_movement=False, movelist=[0])
+        if self.search is None:
+            self.search = AStarTask(self.Map, self.player.position, self.enemy.position, allow_diagonal_movement=False, movelist=[0])
+        if self.search.run(2):
+            self.path = self.search.path
+            self.search = None
 
     def on_key_press(self, key, modifiers):
         """Called whenever a key is pressed. """
@@ -83,8 +83,8 @@ class MyGame(arcade.Window):
         if removing: self.wall_list.remove(removing[0])
 
 
-        num = SearchTilesAround(self.Map, self.player.position, allow_diagonal_movement=False, movelist=[0])
-        print(num)
+        region = SearchTilesAround(self.Map, self.player.position, allow_diagonal_movement=False, movelist=[0])
+        print(len(region))
 
 
     def on_draw(self):
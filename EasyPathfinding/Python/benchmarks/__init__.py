@@ -0,0 +1,9 @@
+"""
+Headless benchmarks for every search function.
+
+Run from `EasyPathfinding/Python` with:
+python -m benchmarks --sizes 64 128 256 --output results.json
+"""
+
+from benchmarks.maps import *
+from benchmarks.suite import *
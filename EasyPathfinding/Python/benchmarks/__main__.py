@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+from benchmarks.suite import run, compare
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Times every search function on seeded random maps."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256],
+                        help="map widths to run, up to 2048 (default: 64 128 256)")
+    parser.add_argument("--queries", type=int, default=20, help="queries per case")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="times every case is run, the fastest counts (default: 5)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--density", type=float, default=.3, help="share of tiles that are walls")
+    parser.add_argument("--only", nargs="+", help="only run these functions")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--baseline", help="compare against this earlier output")
+    parser.add_argument("--tolerance", type=float, default=.2,
+                        help="how much worse than the baseline counts as a regression")
+    parser.add_argument("--gate-time", action="store_true",
+                        help="also count queries/sec that fell behind the baseline as regressions")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.queries, args.seed, args.density, args.only, args.repeats)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        for key in ("seed", "density", "queries"):
+            if baseline["meta"].get(key) != results["meta"][key]:
+                print("warning: baseline was run with %s=%s, not %s" % (
+                    key, baseline["meta"].get(key), results["meta"][key]), file=sys.stderr)
+        results["regressions"] = compare(results, baseline, args.tolerance, args.gate_time)
+        if results["regressions"]:
+            status = 1
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    for regression in results.get("regressions", ()):
+        print("REGRESSION %(name)s %(metric)s: %(baseline)s -> %(current)s" % regression, file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import random
+from typing import List, Tuple
+
+from customMaps import LivingMap, ArrayMap, BarrierDict, LayeredBarrierDict
+
+
+__all__ = (
+    "MAP_KINDS",
+    "random_walls",
+    "make_map",
+)
+
+
+TILESIZE = 50
+MAP_KINDS = ("LivingMap", "ArrayMap", "BarrierDict", "LayeredBarrierDict")
+
+
+def random_walls(size: int, seed: int, density: float=.3) -> List[Tuple[int, int]]:
+    """
+    Wall tiles of a seeded random map, like the examples (30% walls)
+    """
+    rng = random.Random(seed)
+    return [(x, y) for x in range(size) for y in range(size) if rng.random() < density]
+
+
+def make_map(kind: str, size: int, walls: List[Tuple[int, int]]):
+    """
+    Builds a `size` x `size` map of `kind` where walls are 1 and floor is 0
+    """
+    if kind == "LivingMap":
+        Map = LivingMap(size, size, size*size, tilesize=TILESIZE)
+        for x, y in walls:
+            Map.graph[x][y] = 1
+    elif kind == "ArrayMap":
+        Map = ArrayMap(size, size, tilesize=TILESIZE)
+        for x, y in walls:
+            Map.tiles[x*size + y] = 1
+    elif kind == "BarrierDict":
+        end = (size - 1)*TILESIZE
+        Map = BarrierDict(TILESIZE, 0, end, 0, end, base=0)
+        for x, y in walls:
+            Map.barrier_dict[x][y] = 1
+    elif kind == "LayeredBarrierDict":
+        end = (size - 1)*TILESIZE
+        Map = LayeredBarrierDict(TILESIZE, 0, end, 0, end, base=0)
+        for x, y in walls:
+            Map.push_layer(x, y, 1)
+    else:
+        raise ValueError("Unknown map kind %r" % kind)
+    return Map
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import gc
+import pickle
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from functools import partial
+from typing import Dict, List, Optional
+
+from pathfinding import (
+    AStarSearch, AStarWDict, AStarWLayeredDict,
+    SearchTilesAround, SearchAroundWDict, SearchAroundWLayeredDict,
+)
+from customMaps import ObservablePoint
+from searchstats import SearchStats
+from landmarks import LandmarkTable
+from pathserver import _delta, _snapshot
+from benchmarks.maps import TILESIZE, random_walls, make_map
+
+
+__all__ = (
+    "CASES",
+    "PAYLOAD_KINDS",
+    "run",
+    "compare",
+)
+
+
+class _Landmarked:
+    """
+    A* with a `LandmarkTable`, built by `prepare` outside the timed queries
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.table = None
+
+    def prepare(self, Map) -> None:
+        self.table = LandmarkTable(Map, [0])
+
+    def __call__(self, Map, *args, **kwargs):
+        return self.function(Map, *args, landmarks=self.table, **kwargs)
+
+
+class _Mover:
+    """
+    A moving barrier whose position tells its map when it is set
+    """
+
+    def __init__(self, x, y):
+        self.position = ObservablePoint([x, y])
+        self.moved = False
+
+
+# Map kinds that hold moving barriers, whose `PathServer` payloads are measured
+PAYLOAD_KINDS = ("BarrierDict", "LayeredBarrierDict")
+
+
+# (name, function, map kind, needs an end point)
+CASES = (
+    ("AStarSearch", AStarSearch, "LivingMap", True),
+    ("AStarSearch", AStarSearch, "ArrayMap", True),
+    ("AStarSearch+bidirectional", partial(AStarSearch, bidirectional=True), "LivingMap", True),
+    ("AStarSearch+bidirectional", partial(AStarSearch, bidirectional=True), "ArrayMap", True),
+    ("AStarSearch+landmarks", _Landmarked(AStarSearch), "LivingMap", True),
+    ("AStarWDict", AStarWDict, "BarrierDict", True),
+    ("AStarWDict+landmarks", _Landmarked(AStarWDict), "BarrierDict", True),
+    ("AStarWLayeredDict", AStarWLayeredDict, "LayeredBarrierDict", True),
+    ("SearchTilesAround", SearchTilesAround, "LivingMap", False),
+    ("SearchTilesAround", SearchTilesAround, "ArrayMap", False),
+    ("SearchAroundWDict", SearchAroundWDict, "BarrierDict", False),
+    ("SearchAroundWLayeredDict", SearchAroundWLayeredDict, "LayeredBarrierDict", False),
+)
+
+
+def _queries(size: int, walls, count: int, seed: int):
+    """
+    Seeded (start, end) pairs in pixels, both on floor tiles
+    """
+    rng = random.Random(seed)
+    blocked = set(walls)
+    points = []
+    while len(points) < count*2:
+        tile = (rng.randrange(size), rng.randrange(size))
+        if not tile in blocked:
+            points.append((tile[0]*TILESIZE, tile[1]*TILESIZE))
+    return list(zip(points[::2], points[1::2]))
+
+
+def _call(function, Map, start, end, needs_end, stats=None):
+    if needs_end:
+        return function(Map, start, end, True, [0], stats=stats)
+    return function(Map, start, True, [0], stats=stats)
+
+
+def _payloads(kind: str, size: int, walls, seed: int) -> Dict:
+    """
+    Pickled size of what `PathServer` sends its workers: the whole map,
+    and the delta after one moving barrier steps to the next tile
+    """
+    Map = make_map(kind, size, walls)
+    rng = random.Random(seed)
+    blocked = set(walls)
+    for _ in range(size):
+        tile = (rng.randrange(size - 1), rng.randrange(size))
+        if not tile in blocked:
+            Map.add(_Mover(tile[0]*TILESIZE, tile[1]*TILESIZE))
+    snapshot_bytes = len(pickle.dumps(_snapshot(Map)))
+
+    barrier = Map.moving_barriers[0]
+    barrier.position[0] += TILESIZE
+    changed = Map.apply_moves()
+    return {
+        "name": "PathServer/%s/%d" % (kind, size),
+        "function": "PathServer",
+        "map": kind,
+        "size": size,
+        "delta_tiles": len(changed),
+        "delta_bytes": len(pickle.dumps(("delta", _delta(Map, changed)))),
+        "snapshot_bytes": snapshot_bytes,
+    }
+
+
+def run(sizes: List[int], queries: int=20, seed: int=0, density: float=.3,
+        names: Optional[List[str]] = None, repeats: int=5) -> Dict:
+    """
+    Times every case on every size and returns the results as a dict
+    that can be dumped straight to JSON.
+    Every case is timed `repeats` times and the fastest run is kept,
+    the slower ones were held up by something else.
+    """
+    results = []
+    for size in sizes:
+        walls = random_walls(size, seed, density)
+        pairs = _queries(size, walls, queries, seed + 1)
+        maps = {}
+
+        for name, function, kind, needs_end in CASES:
+            if names and not name in names:
+                continue
+            if not kind in maps:
+                start = time.perf_counter()
+                maps[kind] = make_map(kind, size, walls)
+                maps[kind + " build"] = time.perf_counter() - start
+            Map = maps[kind]
+
+            prepare_seconds = None
+            prepare = getattr(function, "prepare", None)
+            if prepare is not None:
+                start = time.perf_counter()
+                prepare(Map)
+                prepare_seconds = time.perf_counter() - start
+
+            seconds = None
+            for _ in range(max(1, repeats)):
+                gc.collect()
+                found = 0
+                start = time.perf_counter()
+                for a, b in pairs:
+                    if _call(function, Map, a, b, needs_end):
+                        found += 1
+                elapsed = time.perf_counter() - start
+                if seconds is None or elapsed < seconds:
+                    seconds = elapsed
+
+            # Expansions are counted on their own run so timing stays stats-free
+            expansions = 0
+            stats = SearchStats()
+            for a, b in pairs:
+                _call(function, Map, a, b, needs_end, stats)
+                expansions += stats.expanded
+
+            # Memory is measured on its own run, tracemalloc slows everything down
+            gc.collect()
+            tracemalloc.start()
+            _call(function, Map, pairs[0][0], pairs[0][1], needs_end)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results.append({
+                "name": "%s/%s/%d" % (name, kind, size),
+                "function": name,
+                "map": kind,
+                "size": size,
+                "queries": len(pairs),
+                "found": found,
+                "seconds": seconds,
+                "queries_per_sec": len(pairs)/seconds if seconds else None,
+                "expansions": expansions,
+                "peak_memory": peak,
+                "map_build_seconds": maps[kind + " build"],
+                "prepare_seconds": prepare_seconds,
+            })
+
+        if not names or "PathServer" in names:
+            for kind in PAYLOAD_KINDS:
+                results.append(_payloads(kind, size, walls, seed + 2))
+
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": seed,
+            "density": density,
+            "queries": queries,
+            "repeats": repeats,
+            "sizes": list(sizes),
+        },
+        "results": results,
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float=.2, timing: bool=False) -> List[Dict]:
+    """
+    Cases that expanded more tiles, used more memory or sent bigger
+    `PathServer` payloads than in `baseline`, by more than `tolerance`. These counts do not change from run to run,
+    so only real changes show up.
+    Queries/sec are only compared with `timing`, they move with whatever
+    else the machine is doing.
+    """
+    checks = [("expansions", lambda new, old: new > old*(1 + tolerance)),
+              ("peak_memory", lambda new, old: new > old*(1 + tolerance)),
+              ("delta_bytes", lambda new, old: new > old*(1 + tolerance)),
+              ("snapshot_bytes", lambda new, old: new > old*(1 + tolerance))]
+    if timing:
+        checks.append(("queries_per_sec", lambda new, old: new < old*(1 - tolerance)))
+
+    old = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        before = old.get(result["name"])
+        if before is None:
+            continue
+        for key, worse in checks:
+            if result.get(key) is None or before.get(key) is None:
+                continue
+            if worse(result[key], before[key]):
+                regressions.append({
+                    "name": result["name"],
+                    "metric": key,
+                    "baseline": before[key],
+                    "current": result[key],
+                })
+    return regressions
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+from array import array
+from collections import deque
+from typing import Iterable, Optional
+from pathfindingfuncs import STRAIGHT_SQUARES, DIAGONAL_SQUARES
+
+
+__all__ = (
+    "ComponentIndex",
+)
+
+
+class ComponentIndex:
+    """
+    Labels every walkable tile with the region it belongs to, so a search
+    whose start and end are in different regions can give up at once.
+
+    Regions are merged with union-find when a tile opens up. When a tile is
+    blocked, only the region it was in is checked for a split.
+    Changes are read from the map's change log before every query, edits
+    made behind the map's back (like writing to `LivingMap.graph`) are missed.
+    Usually made through `Map.track_components`.
+    """
+
+    __slots__ = (
+        "Map",
+        "movelist",
+        "adjacent_squares",
+        "walkable",
+        "version",
+        "left",
+        "bottom",
+        "width",
+        "height",
+        "labels",
+        "parent"
+    )
+
+    def __init__(self, Map, movelist=[], allow_diagonal_movement: bool=True):
+        """
+        :param Map: Map to label, it needs `walkable`, `bounds`, `version` and `changed_since`
+        :param movelist: Tiles that can be walked on
+        :param bool allow_diagonal_movement: Whether diagonal steps connect tiles
+        """
+        self.Map = Map
+        self.movelist = movelist
+        self.adjacent_squares = DIAGONAL_SQUARES if allow_diagonal_movement else STRAIGHT_SQUARES
+        self.build()
+
+    @classmethod
+    def restore(cls, Map, movelist, allow_diagonal_movement: bool, labels, parent: list) -> ComponentIndex:
+        """
+        Index over `Map` from labels worked out earlier, like the ones `Map.save` keeps,
+        without labelling the map again
+        """
+        index = cls.__new__(cls)
+        index.Map = Map
+        index.movelist = movelist
+        index.adjacent_squares = DIAGONAL_SQUARES if allow_diagonal_movement else STRAIGHT_SQUARES
+        index.walkable = Map.walkable(movelist)
+        index.version = Map.version
+        index.left, index.bottom, right, top = Map.bounds()
+        index.width = right - index.left
+        index.height = top - index.bottom
+        index.labels = labels
+        index.parent = parent
+        return index
+
+    def build(self) -> None:
+        """
+        Labels the whole map from scratch
+        """
+        Map = self.Map
+        self.walkable = walkable = Map.walkable(self.movelist)
+        self.version = Map.version
+        self.left, self.bottom, right, top = Map.bounds()
+        self.width = right - self.left
+        self.height = top - self.bottom
+        self.labels = array("i", [0]) * (self.width * self.height)
+        self.parent = [0]  # Label 0 means blocked
+
+        for x in range(self.left, right):
+            for y in range(self.bottom, top):
+                if walkable(x, y) and not self.labels[self._index(x, y)]:
+                    self._fill((x, y), self._new_label())
+
+    def _index(self, x, y):
+        return (x - self.left)*self.height + y - self.bottom
+
+    def _inside(self, x, y):
+        return 0 <= x - self.left < self.width and 0 <= y - self.bottom < self.height
+
+    def _new_label(self):
+        self.parent.append(len(self.parent))
+        return len(self.parent) - 1
+
+    def _find(self, label):
+        parent = self.parent
+        root = label
+        while parent[root] != root:
+            root = parent[root]
+        while parent[label] != root:
+            parent[label], label = root, parent[label]
+        return root
+
+    def _fill(self, start, label) -> None:
+        """
+        Gives every tile connected to `start` the `label`
+        """
+        labels = self.labels
+        walkable = self.walkable
+        adjacent_squares = self.adjacent_squares
+        index = self._index
+
+        labels[index(*start)] = label
+        queue = deque([start])
+        while queue:
+            x, y = queue.popleft()
+            for dx, dy in adjacent_squares:
+                nx = x + dx
+                ny = y + dy
+                if not walkable(nx, ny) or labels[index(nx, ny)] == label:
+                    continue
+                labels[index(nx, ny)] = label
+                queue.append((nx, ny))
+
+    def _reach(self, start, targets):
+        """
+        Tiles connected to `start`, None as soon as all of `targets` were reached
+        """
+        walkable = self.walkable
+        adjacent_squares = self.adjacent_squares
+        remaining = set(targets)
+
+        reached = {start}
+        queue = deque([start])
+        while queue:
+            x, y = queue.popleft()
+            for dx, dy in adjacent_squares:
+                neighbour = (x + dx, y + dy)
+                if neighbour in reached or not walkable(neighbour[0], neighbour[1]):
+                    continue
+                reached.add(neighbour)
+                queue.append(neighbour)
+                remaining.discard(neighbour)
+                if not remaining:
+                    return None
+        return reached
+
+    def _neighbours(self, tile):
+        x, y = tile
+        walkable = self.walkable
+        return [(x + dx, y + dy) for dx, dy in self.adjacent_squares if walkable(x + dx, y + dy)]
+
+    def _open(self, tile) -> None:
+        labels = self.labels
+        # Tiles opened in the same batch may not have a label yet
+        roots = set(self._find(labels[self._index(*n)]) for n in self._neighbours(tile) if labels[self._index(*n)])
+        if not roots:
+            self.labels[self._index(*tile)] = self._new_label()
+            return
+        root = roots.pop()
+        for other in roots:
+            self.parent[other] = root
+        self.labels[self._index(*tile)] = root
+
+    def _close(self, tiles) -> None:
+        labels = self.labels
+        index = self._index
+
+        # Group the tiles around the closed ones by the region they were in
+        regions = {}
+        for tile in tiles:
+            labels[index(*tile)] = 0
+        for tile in tiles:
+            for neighbour in self._neighbours(tile):
+                label = labels[index(*neighbour)]
+                if label:  # Unlabelled ones are opened in this batch, `_open` deals with those
+                    regions.setdefault(self._find(label), set()).add(neighbour)
+
+        # Keep splitting off whatever part of the old region can not reach the rest
+        for pending in regions.values():
+            while len(pending) > 1:
+                first = pending.pop()
+                reached = self._reach(first, pending)
+                if reached is None:
+                    break  # Everything is still connected
+                label = self._new_label()
+                for x, y in reached:
+                    labels[index(x, y)] = label
+                pending -= reached
+
+    def update(self, changed: Optional[Iterable] = None) -> None:
+        """
+        Updates the labels around tiles that changed.
+
+        :param changed: Tiles that changed, if not given they are read
+            from the map's change log
+        """
+        if changed is None:
+            changed = self.Map.changed_since(self.version)
+            if changed is None:
+                self.build()
+                return
+        self.version = self.Map.version
+
+        labels = self.labels
+        walkable = self.walkable
+        opened = []
+        closed = []
+        for tile in changed:
+            if not self._inside(*tile):
+                continue
+            is_open = bool(walkable(*tile))
+            if is_open != bool(labels[self._index(*tile)]):
+                (opened if is_open else closed).append(tile)
+
+        # Splits are found first, a split may already label some of the opened tiles
+        if closed:
+            self._close(closed)
+        for tile in opened:
+            if not labels[self._index(*tile)]:
+                self._open(tile)
+
+    def label(self, tile) -> int:
+        """
+        Region of a tile, 0 if it is blocked or off the map
+        """
+        if self.version != self.Map.version:
+            self.update()
+        if not self._inside(*tile):
+            return 0
+        return self._find(self.labels[self._index(*tile)])
+
+    def connected(self, start, end) -> bool:
+        """
+        Whether a path can exist from tile `start` to tile `end`.
+
+        Like the searches, `start` itself may be blocked as long as
+        one of the tiles next to it is not.
+        """
+        if start == end:
+            return True
+        goal = self.label(end)
+        if not goal:
+            return False
+        if self.label(start) == goal:
+            return True
+        if self.walkable(*start):
+            return False
+        return any(self.label(tile) == goal for tile in self._neighbours(start))
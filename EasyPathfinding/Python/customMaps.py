@@ -2,15 +2,25 @@ from __future__ import annotations
 
 from customtypes import Point, BarrierType
 from typing import Union, Optional, List
+import tempfile
+from array import array
+from collections import deque, OrderedDict
+from functools import partial
 from pathfindingfuncs import *
+from components import ComponentIndex
+from mapfile import write_map, read_map
 
 
 __all__ = (
     "CustomList",
+    "TrackedMap",
     "LivingMap",
+    "ArrayMap",
+    "ObservablePoint",
     "BarrierObject",
     "BarrierDict",
-    "LayeredBarrierDict"
+    "LayeredBarrierDict",
+    "ChunkMap"
 )
 
 
@@ -25,7 +35,185 @@ class CustomList(list):
         return super().__getitem__(int(__name))
 
 
-class LivingMap(object):
+def _encode(values) -> tuple:
+    """
+    (list of the different values, array of positions in that list), for tiles
+    that can hold anything JSON can
+    """
+    table = []
+    numbers = {}
+    positions = []
+    for value in values:
+        number = numbers.get(value)
+        if number is None:
+            number = numbers[value] = len(table)
+            table.append(value)
+        positions.append(number)
+    typecode = "B" if len(table) <= 256 else "H" if len(table) <= 65536 else "I"
+    return table, array(typecode, positions)
+
+
+def _decode(table, positions) -> list:
+    if table == list(range(len(table))):
+        return positions.tolist()
+    return list(map(table.__getitem__, positions))
+
+
+class TrackedMap(object):
+    """
+    Version counter and log of changed tiles, shared by all the maps.
+
+    Every edit made through a map's methods bumps `version` and logs the tile,
+    so caches and planners can tell what changed since they last looked.
+    Only the last `max_changes` edits are kept.
+    """
+
+    __slots__ = ()
+
+    max_changes = 4096
+
+    # Cheapest tile cost `cost_grid` takes, below it `heuristic` is no longer a lower bound
+    min_cost = .2
+
+    def _changed(self, x: int, y: int) -> None:
+        self.version += 1
+        self.changes.append((self.version, (x, y)))
+
+    def changed_since(self, version: int):
+        """
+        Set of tiles changed after `version`,
+        None if the log does not reach back that far
+        """
+        if version >= self.version:
+            return set()
+        changes = self.changes
+        if not changes or changes[0][0] > version + 1:
+            return None
+
+        tiles = set()
+        for changed, tile in reversed(changes):
+            if changed <= version:
+                break
+            tiles.add(tile)
+        return tiles
+
+    def track_components(self, movelist=[], allow_diagonal_movement: bool=True) -> ComponentIndex:
+        """
+        Keeps a `ComponentIndex` for this movelist, searches made with the
+        same movelist return `[]` at once when the end can not be reached.
+        """
+        key = (frozenset(movelist), allow_diagonal_movement)
+        index = self.components.get(key)
+        if index is None:
+            index = self.components[key] = ComponentIndex(self, movelist, allow_diagonal_movement)
+        return index
+
+    def untrack_components(self, movelist=[], allow_diagonal_movement: bool=True) -> None:
+        self.components.pop((frozenset(movelist), allow_diagonal_movement), None)
+
+    def cost_grid(self, movelist, costs) -> array:
+        """
+        Returns the cost of stepping onto every tile, by flat index
+        `(x - left)*(top - bottom) + (y - bottom)` of `bounds`.
+
+        Tiles not in `movelist` cost 0 (can not be walked on), the others
+        `costs.get(tile, 1)`. The grid is built once per movelist and costs,
+        after that only the tiles in the change log are redone.
+        """
+        key = (frozenset(movelist), frozenset(costs.items()))
+        entry = self.cost_grids.get(key)
+        if entry is not None and entry[0] == self.version:
+            return entry[1]
+
+        def price(value):
+            return costs.get(value, 1) if value in movelist else 0
+
+        changed = self.changed_since(entry[0]) if entry is not None else None
+        if changed is None:
+            if min(costs.values(), default=1) < self.min_cost:
+                raise ValueError("Tile costs below %s make the heuristic overestimate" % self.min_cost)
+            grid = array("d", map(price, self._values()))
+            entry = self.cost_grids[key] = [self.version, grid]
+        else:
+            grid = entry[1]
+            left, bottom, _, top = self.bounds()
+            height = top - bottom
+            for x, y in changed:
+                grid[(x - left)*height + y - bottom] = price(self._value(x, y))
+            entry[0] = self.version
+        return grid
+
+    def weighted(self, movelist, costs):
+        """
+        Like `walkable`, but the function returns the cost of stepping onto
+        (x, y) from `cost_grid`, 0 if it can not be walked on
+        """
+        grid = self.cost_grid(movelist, costs)
+        left, bottom, right, top = self.bounds()
+        length = right - left
+        height = top - bottom
+        def check(x, y):
+            x -= left
+            y -= bottom
+            if x < 0 or y < 0 or x >= length or y >= height:
+                return 0
+            return grid[x*height + y]
+        return check
+
+    def save(self, filename: str) -> None:
+        """
+        Writes the map to a binary file that `load` maps straight back into memory.
+
+        Tracked component indexes and cost grids are saved along with it, so
+        they do not have to be worked out again. Tile values have to be
+        something JSON can hold, moving barriers are not saved.
+        """
+        meta, sections = self._sections()
+        meta["kind"] = type(self).__name__
+        meta["tilesize"] = self.tilesize
+        meta["version"] = self.version
+
+        meta["components"] = []
+        for i, ((_, diagonal), index) in enumerate(self.components.items()):
+            index.update()
+            meta["components"].append([list(index.movelist), diagonal])
+            sections["labels%d" % i] = index.labels
+            sections["parents%d" % i] = array("i", index.parent)
+
+        meta["cost_grids"] = []
+        for i, (movelist, costs) in enumerate(list(self.cost_grids)):
+            sections["costs%d" % i] = self.cost_grid(movelist, dict(costs))
+            meta["cost_grids"].append([list(movelist), [list(item) for item in costs]])
+
+        write_map(filename, meta, sections)
+
+    @classmethod
+    def load(cls, filename: str):
+        """
+        Opens a map written by `save`. Flat tile buffers are used straight
+        from the mapped file, edits to the map never reach the file.
+        """
+        meta, sections = read_map(filename)
+        if meta["kind"] != cls.__name__:
+            raise TypeError("%s holds a %s, not a %s" % (filename, meta["kind"], cls.__name__))
+        Map = cls.__new__(cls)
+        Map.tilesize = meta["tilesize"]
+        Map.version = meta["version"]
+        Map.changes = deque(maxlen=cls.max_changes)
+        Map.components = {}
+        Map.cost_grids = {}
+        Map._restore(meta, sections)
+
+        for i, (movelist, diagonal) in enumerate(meta["components"]):
+            index = ComponentIndex.restore(Map, movelist, diagonal, sections["labels%d" % i], list(sections["parents%d" % i]))
+            Map.components[(frozenset(movelist), diagonal)] = index
+        for i, (movelist, costs) in enumerate(meta["cost_grids"]):
+            key = (frozenset(movelist), frozenset(map(tuple, costs)))
+            Map.cost_grids[key] = [Map.version, sections["costs%d" % i]]
+        return Map
+
+
+class LivingMap(TrackedMap):
     """Custom Map"""
 
     __slots__ = (
@@ -34,6 +222,10 @@ class LivingMap(object):
         "graph",
         "length",
         "height",
+        "version",
+        "changes",
+        "components",
+        "cost_grids",
         "__weakref__"
     )
 
@@ -44,6 +236,10 @@ class LivingMap(object):
         self.height = y_length
         self.size = size
         self.tilesize = tilesize
+        self.version = 0  # Goes up every time the map is changed
+        self.changes = deque(maxlen=self.max_changes)
+        self.components = {}  # ComponentIndex per (movelist, diagonal)
+        self.cost_grids = {}  # [version, cost of every tile] per (movelist, costs)
 
         self.graph = CustomList()#[[0 for tile in range(y_length)] for tiles in range(x_length)]
         for tiles in range(x_length):
@@ -60,10 +256,49 @@ class LivingMap(object):
             count += 1
 
     def change(self, x:int, y:int, barrier: int) -> None:
-        x = int(x/50)
-        y = int(y/50)
+        x = int(x/self.tilesize)
+        y = int(y/self.tilesize)
 
         self.graph[x][y] = barrier
+        self._changed(x, y)
+
+    def walkable(self, movelist):
+        """
+        Returns a function that tells if the tile at (x, y) can be walked on
+        """
+        graph = self.graph
+        length = self.length
+        height = self.height
+        def check(x, y):
+            if x < 0 or y < 0 or x >= length or y >= height:
+                return False
+            return graph[x][y] in movelist
+        return check
+
+    def bounds(self):
+        """
+        (left, bottom, right, top) in tiles, right and top are exclusive
+        """
+        return (0, 0, self.length, self.height)
+
+    def _value(self, x, y):
+        return self.graph[x][y]
+
+    def _values(self):
+        for column in self.graph:
+            yield from column
+
+    def _sections(self):
+        values, tiles = _encode(self._values())
+        meta = {"length": self.length, "height": self.height, "size": self.size, "values": values}
+        return meta, {"tiles": tiles}
+
+    def _restore(self, meta, sections) -> None:
+        self.length = meta["length"]
+        self.height = height = meta["height"]
+        self.size = meta["size"]
+        tiles = _decode(meta["values"], sections["tiles"])
+        self.graph = CustomList(CustomList(tiles[x*height:(x+1)*height]) for x in range(self.length))
 
     def __getitem__(self, i):
         return self.graph[i]
@@ -71,16 +306,155 @@ class LivingMap(object):
     def __setitem__(self, x, y, val):
         self.graph[x/self.tilesize][y/self.tilesize] = val
 
+class ArrayMap(TrackedMap):
+    """
+    Map that keeps every tile in one flat, contiguous array.
+
+    Tile (x, y) is stored at `x*height + y`. The default typecode "B" stores
+    one byte per tile, so tile values have to be in range(256).
+    `numpy.frombuffer(Map.tiles, ...)` wraps the same memory without a copy.
+    """
+
+    __slots__ = (
+        "tilesize",
+        "tiles",
+        "length",
+        "height",
+        "masks",
+        "version",
+        "changes",
+        "components",
+        "cost_grids",
+        "__weakref__"
+    )
+
+    def __init__(self, x_length: int, y_length: int,
+                    *args, tilesize: int=50, typecode: str="B"
+                    ) -> None:
+        self.length = x_length
+        self.height = y_length
+        self.tilesize = tilesize
+        self.version = 0  # Goes up every time the map is changed
+        self.changes = deque(maxlen=self.max_changes)
+        self.components = {}  # ComponentIndex per (movelist, diagonal)
+        self.cost_grids = {}  # [version, cost of every tile] per (movelist, costs)
+
+        self.tiles = array(typecode, [0]) * (x_length * y_length)
+        self.masks = {}
+
+        count = 1
+        for barrierlist in args:
+            for barrier in barrierlist:
+                x = int(barrier.center_x/tilesize)
+                y = int(barrier.center_y/tilesize)
+                self.tiles[x*y_length + y] = count
+            count += 1
+
+    @property
+    def typecode(self) -> str:
+        tiles = self.tiles
+        return tiles.typecode if isinstance(tiles, array) else tiles.format
+
+    @classmethod
+    def from_living_map(cls, Map: LivingMap, typecode: str="B") -> ArrayMap:
+        new = cls(Map.length, Map.height, tilesize=Map.tilesize, typecode=typecode)
+        tiles = new.tiles
+        height = Map.height
+        for x, column in enumerate(Map.graph):
+            tiles[x*height:(x+1)*height] = array(typecode, column)
+        return new
+
+    def view(self) -> memoryview:
+        """
+        Zero-copy, read-only 2d view of the tiles, index it with `view[x, y]`
+        """
+        return memoryview(self.tiles).toreadonly().cast("B").cast(
+            self.typecode, (self.length, self.height)
+        )
+
+    def change(self, x: int, y: int, barrier: int) -> None:
+        x = int(x/self.tilesize)
+        y = int(y/self.tilesize)
+        index = x*self.height + y
+
+        self.tiles[index] = barrier
+        for allowed, mask in self.masks.items():
+            mask[index] = barrier in allowed
+        self._changed(x, y)
+
+    def passable(self, movelist) -> bytearray:
+        """
+        Returns a mask with a 1 for every tile that is in `movelist`.
+
+        The mask is built once per movelist and kept up to date by `change`.
+        """
+        allowed = frozenset(movelist)
+        mask = self.masks.get(allowed)
+        if mask is None:
+            if self.typecode == "B":
+                table = bytes(i in allowed for i in range(256))
+                mask = bytearray(self.tiles).translate(table)
+            else:
+                mask = bytearray(tile in allowed for tile in self.tiles)
+            self.masks[allowed] = mask
+        return mask
+
+    def walkable(self, movelist):
+        """
+        Returns a function that tells if the tile at (x, y) can be walked on
+        """
+        mask = self.passable(movelist)
+        length = self.length
+        height = self.height
+        def check(x, y):
+            if x < 0 or y < 0 or x >= length or y >= height:
+                return False
+            return mask[x*height + y]
+        return check
+
+    def bounds(self):
+        """
+        (left, bottom, right, top) in tiles, right and top are exclusive
+        """
+        return (0, 0, self.length, self.height)
+
+    def _value(self, x, y):
+        return self.tiles[x*self.height + y]
+
+    def _values(self):
+        return self.tiles
+
+    def _sections(self):
+        return {"length": self.length, "height": self.height}, {"tiles": self.tiles}
+
+    def _restore(self, meta, sections) -> None:
+        self.length = meta["length"]
+        self.height = meta["height"]
+        self.tiles = sections["tiles"]  # A memoryview of the file, not an array
+        self.masks = {}
+
+    def __getitem__(self, x):
+        height = self.height
+        x = int(x)
+        return memoryview(self.tiles).toreadonly()[x*height:(x+1)*height]
+
 class ObservablePoint(list):
     """
     A List that represents a point that moves
 
-    Use when you use AStarBarrierDict
+    Use when you use AStarBarrierDict, a `BarrierDict` that holds a barrier
+    whose `position` is one gets told when it moves through `listener`
     """
-    __slots__ = ("changed")
+    __slots__ = ("changed", "listener")
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.changed = False
+        self.listener = None
     def __setitem__(self, index, item):
         self.changed = True
         super().__setitem__(int(index), int(item))
+        if self.listener is not None:
+            self.listener()
     def __getitem__(self, __name):
         return super().__getitem__(int(__name))
     def __len__(self) -> int:
@@ -93,9 +467,9 @@ class BarrierObject:
         "layer",
         "base"
     )
-    def __init__(self, layer=0, bellow: List[Point] = [], base = None):
+    def __init__(self, layer=0, bellow: Optional[List[Point]] = None, base = None):
         self.barrier = base
-        self.bellow = bellow
+        self.bellow = bellow if bellow is not None else []
         self.layer = layer
         self.base = base
     def get_bellow(self):
@@ -109,16 +483,19 @@ class BarrierObject:
         self.barrier = barrier
     def remove_top(self):
         obj = self.barrier
-        self.barrier = self.bellow.pop()
+        self.barrier = self.bellow.pop() if self.bellow else self.base
         return obj
     def remove(self, barrier):
-        if not barrier in self.layers:
+        if barrier is self.barrier:
+            return self.remove_top()
+        if not barrier in self.bellow:
             return self.base
-        self.layers.remove(barrier)
+        self.bellow.remove(barrier)
+        return barrier
     def __eq__(self, other: BarrierObject) -> bool:
         return self.layer == other.layer
 
-class BarrierDict:
+class BarrierDict(TrackedMap):
     """
     Class that manages a dict of barriers
     that can be encountered during A* path finding.
@@ -134,7 +511,15 @@ class BarrierDict:
         "height",
         "static_barriers",
         "moving_barriers",
-        "barrier_dict"
+        "barrier_dict",
+        "base",
+        "placed",
+        "occupants",
+        "moved",
+        "version",
+        "changes",
+        "components",
+        "cost_grids"
     )
     def __init__(self,
                  tilesize: int,
@@ -164,9 +549,16 @@ class BarrierDict:
         self.length = int(self.top - self.bottom)
         self.height = int(self.right - self.left)
 
-        self.moving_barriers = moving_barriers
+        self.moving_barriers = moving_barriers if moving_barriers is not None else []
         self.barrier_dict = {}
         self.base = base
+        self.placed = {}  # id of a moving barrier -> tile it was put on
+        self.occupants = {}  # tile -> [what was there before, moving barriers on it...]
+        self.moved = {}  # Moving barriers waiting for `apply_moves`, by id
+        self.version = 0  # Goes up every time the map is changed
+        self.changes = deque(maxlen=self.max_changes)
+        self.components = {}  # ComponentIndex per (movelist, diagonal)
+        self.cost_grids = {}  # [version, cost of every tile] per (movelist, costs)
 
         self.set_up_dict()
 
@@ -175,33 +567,187 @@ class BarrierDict:
             self.barrier_dict[cx] = {}
             for cy in range(self.bottom, self.top + 1):
                 self.barrier_dict[cx][cy] = self.base
+        self.placed.clear()
+        self.occupants.clear()
+        self.cost_grids.clear()
         for barrier in self.moving_barriers:
-            x, y = collapse(barrier.position, self.tilesize)
-            self.barrier_dict[x][y] = barrier
+            self._watch(barrier)
+            self._move(barrier, [])
+
+    def walkable(self, movelist):
+        """
+        Returns a function that tells if the tile at (x, y) can be walked on
+        """
+        graph = self.barrier_dict
+        def check(x, y):
+            column = graph.get(x)
+            if column is None or not y in column:
+                return False
+            return column[y] in movelist
+        return check
+
+    def bounds(self):
+        """
+        (left, bottom, right, top) in tiles, right and top are exclusive
+        """
+        return (self.left, self.bottom, self.right + 1, self.top + 1)
+
+    def _value(self, x, y):
+        return self.barrier_dict[x][y]
+
+    def _values(self):
+        for x in range(self.left, self.right + 1):
+            column = self.barrier_dict[x]
+            for y in range(self.bottom, self.top + 1):
+                yield column[y]
+
+    def _sections(self):
+        def values():
+            # What is under the moving barriers
+            for x, y in ((x, y) for x in range(self.left, self.right + 1) for y in range(self.bottom, self.top + 1)):
+                stack = self.occupants.get((x, y))
+                yield self.barrier_dict[x][y] if stack is None else stack[0]
+        values, tiles = _encode(values())
+        meta = {"left": self.left, "right": self.right, "bottom": self.bottom, "top": self.top,
+                "base": self.base, "values": values}
+        return meta, {"tiles": tiles}
+
+    def _restore_bounds(self, meta) -> None:
+        self.left = meta["left"]
+        self.right = meta["right"]
+        self.bottom = meta["bottom"]
+        self.top = meta["top"]
+        self.length = self.top - self.bottom
+        self.height = self.right - self.left
+        self.base = meta["base"]
+        self.moving_barriers = []
+        self.barrier_dict = {}
+        self.placed = {}
+        self.occupants = {}
+        self.moved = {}
+
+    def _restore(self, meta, sections) -> None:
+        self._restore_bounds(meta)
+        tiles = _decode(meta["values"], sections["tiles"])
+        rows = range(self.bottom, self.top + 1)
+        count = len(rows)
+        for i, x in enumerate(range(self.left, self.right + 1)):
+            self.barrier_dict[x] = dict(zip(rows, tiles[i*count:(i+1)*count]))
+
+    def _place(self, barrier, x, y):
+        stack = self.occupants.get((x, y))
+        if stack is None:
+            stack = self.occupants[(x, y)] = [self.barrier_dict[x][y]]
+        stack.append(barrier)
+        self.barrier_dict[x][y] = barrier
+
+    def _vacate(self, barrier, x, y):
+        # Whatever was under it (another barrier or the tile itself) shows again
+        stack = self.occupants[(x, y)]
+        for i in range(len(stack) - 1, 0, -1):
+            if stack[i] is barrier:
+                del stack[i]
+                break
+        if self.barrier_dict[x][y] is barrier:
+            self.barrier_dict[x][y] = stack[-1]
+        if len(stack) == 1:
+            del self.occupants[(x, y)]
+
+    def _move(self, barrier, changed: List[Point]) -> None:
+        """
+        Takes `barrier` off the tile it was on and puts it on the one it is on now
+        """
+        tile = collapse(barrier.position, self.tilesize)
+        old = self.placed.get(id(barrier))
+        if old == tile:
+            return
+        if old is not None:
+            self._vacate(barrier, *old)
+            self._changed(*old)
+            changed.append(old)
+        self._place(barrier, *tile)
+        self._changed(*tile)
+        changed.append(tile)
+        self.placed[id(barrier)] = tile
+
+    def _watch(self, barrier) -> None:
+        position = getattr(barrier, "position", None)
+        if isinstance(position, ObservablePoint):
+            position.listener = partial(self.mark_moved, barrier)
+
+    def _forget(self, barrier) -> None:
+        """
+        Takes a moving barrier off the map and stops following it
+        """
+        position = getattr(barrier, "position", None)
+        if isinstance(position, ObservablePoint):
+            position.listener = None
+        self.moved.pop(id(barrier), None)
+        tile = self.placed.pop(id(barrier), None)
+        if tile is not None:
+            self._vacate(barrier, *tile)
+            self._changed(*tile)
+
+    def mark_moved(self, barrier) -> None:
+        """
+        Queues a moving barrier for the next `apply_moves`.
+        Barriers with an `ObservablePoint` position are queued when it is set.
+        """
+        self.moved[id(barrier)] = barrier
+
+    def apply_moves(self) -> List[Point]:
+        """
+        Moves only the queued barriers, returns the tiles that changed
+        """
+        changed = []
+        moved = self.moved
+        self.moved = {}
+        for barrier in moved.values():
+            self._move(barrier, changed)
+        return changed
 
-    def recalculate(self):
+    def recalculate(self) -> List[Point]:
+        """
+        Moves every barrier with `moved` set, returns the tiles that changed
+        """
+        changed = []
         for barrier in self.moving_barriers:
-            if not barrier.moved:
-                continue
-            x, y = collapse(barrier.position, self.tilesize)
-            self.barrier_dict[x][y] = barrier
+            if barrier.moved:
+                self._move(barrier, changed)
+        return changed
 
-    def recalculate_moving(self):
+    def recalculate_moving(self) -> List[Point]:
+        """
+        Checks every moving barrier, returns the tiles that changed
+        """
+        changed = []
         for barrier in self.moving_barriers:
-            x, y = collapse(barrier.position, self.tilesize)
-            self.barrier_dict[x][y] = barrier
+            self._move(barrier, changed)
+        return changed
 
     def add(self, barrier):
         self.moving_barriers.append(barrier)
-        x, y = collapse(barrier.position, self.tilesize)
-        self.barrier_dict[x][y] = barrier
+        self._watch(barrier)
+        self._move(barrier, [])
 
     def remove(self, barrier: Union[int, Point]):
+        """
+        Removes a moving barrier by its index, or whatever is on a tile
+        """
         if isinstance(barrier, int):
-            return self.moving_barriers.pop(int)
-        elif isinstance(barrier, Point):
-            temp = self.barrier_dict[barrier[0]][barrier[1]]
-            self.barrier_dict[barrier[0]][barrier[1]] = self.base
+            barrier = self.moving_barriers.pop(barrier)
+            self._forget(barrier)
+            return barrier
+        else:
+            x, y = barrier
+            temp = self.barrier_dict[x][y]
+            # Moving barriers on the tile go with it, they are put back once they move
+            stack = self.occupants.pop((x, y), None)
+            if stack is not None:
+                for moving in stack[1:]:
+                    self.placed.pop(id(moving), None)
+            self.barrier_dict[x][y] = self.base
+            self._changed(x, y)
             return temp
 
 class LayeredBarrierDict(BarrierDict):
@@ -218,8 +764,25 @@ class LayeredBarrierDict(BarrierDict):
         there is the floor underneath(only certian things can go on the floor),
         then when the floor breaks, it is dirt(self.base).
         NOTE: (This can also be used for diff speeds on diff substance)
+
+    Only the top layer of every tile is kept in `top_layers`, one byte per tile
+    at `(x - left)*(top - bottom + 1) + (y - bottom)`, as a number that stands
+    for the layer (`layer_values[number]`). The layers under it are kept in
+    `stacks`, only for the tiles that have more than one.
+    A map can use up to 255 different layers, moving barriers always block.
     """
 
+    __slots__ = (
+        "top_layers",
+        "stacks",
+        "layer_ids",
+        "layer_values",
+        "masks"
+    )
+
+    # Number of a moving barrier in `top_layers`, never in a movelist
+    MOVING = 255
+
     def __init__(self,
                  tilesize: int,
                  left: int,
@@ -238,41 +801,517 @@ class LayeredBarrierDict(BarrierDict):
         :param int bottom: Bottom of playing field
         :param int top: Top of playing field
         """
+        self.layer_ids = {}  # layer -> its number in `top_layers`
+        self.layer_values = []  # number -> layer
+        self.masks = {}
         super().__init__(
             tilesize, left, right, bottom,
             top, moving_barriers=moving_barriers, base=base
         )
 
     def set_up_dict(self):
-        for cx in range(self.left, self.right + 1):
-            self.barrier_dict[cx] = {}
-            for cy in range(self.bottom, self.top + 1):
-                self.barrier_dict[cx][cy] = BarrierObject(self.base)
+        columns = self.right - self.left + 1
+        rows = self.top - self.bottom + 1
+        self.top_layers = bytearray([self._number(self.base)]) * (columns*rows)
+        self.stacks = {}  # index -> [(number, layer) from the bottom up]
+        self.masks.clear()
+        self.cost_grids.clear()
+        self.placed.clear()
         for barrier in self.moving_barriers:
-            x, y = collapse(barrier.position, self.tilesize)
-            self.barrier_dict[x][y].push(barrier)
+            self._watch(barrier)
+            self._move(barrier, [])
 
-    def recalculate(self):
-        for barrier in self.moving_barriers:
-            if not barrier.moved:
-                continue
-            x, y = collapse(barrier.position, self.tilesize)
-            self.barrier_dict[x][y].barrier = barrier
+    def _number(self, layer) -> int:
+        number = self.layer_ids.get(layer)
+        if number is None:
+            number = len(self.layer_values)
+            if number >= self.MOVING:
+                raise ValueError("A LayeredBarrierDict can only hold %d different layers" % self.MOVING)
+            self.layer_ids[layer] = number
+            self.layer_values.append(layer)
+        return number
 
-    def add(self, barrier):
-        self.moving_barriers.append(barrier)
+    def _index(self, x, y) -> int:
+        x = int(x) - self.left
+        y = int(y) - self.bottom
+        rows = self.top - self.bottom + 1
+        if x < 0 or y < 0 or x > self.right - self.left or y >= rows:
+            raise IndexError("Tile (%d, %d) is outside the map" % (x + self.left, y + self.bottom))
+        return x*rows + y
+
+    def _set_top(self, index, number) -> None:
+        self.top_layers[index] = number
+        if self.masks:
+            layer = self.layer_values[number] if number != self.MOVING else None
+            for allowed, mask in self.masks.items():
+                mask[index] = number != self.MOVING and layer in allowed
+
+    def _push(self, index, number, layer) -> None:
+        stack = self.stacks.get(index)
+        if stack is None:
+            below = self.top_layers[index]
+            stack = self.stacks[index] = [(below, self.layer_values[below])]
+        stack.append((number, layer))
+        self._set_top(index, number)
+
+    def _pop(self, index, layer=None):
+        """
+        Takes `layer` (the top one by default) off the tile, returns it.
+        A tile with one layer left goes back to `base`.
+        """
+        stack = self.stacks.get(index)
+        if stack is None:
+            number = self.top_layers[index]
+            if layer is not None and self.layer_values[number] is not layer:
+                return self.base
+            self._set_top(index, self._number(self.base))
+            return self.layer_values[number]
+
+        if layer is None:
+            position = len(stack) - 1
+        else:
+            for position in range(len(stack) - 1, -1, -1):
+                if stack[position][1] is layer:
+                    break
+            else:
+                return self.base
+        removed = stack.pop(position)[1]
+        if not stack:
+            # It was the only layer (a moving barrier), the tile goes back to `base`
+            del self.stacks[index]
+            self._set_top(index, self._number(self.base))
+            return removed
+        if position == len(stack):
+            self._set_top(index, stack[-1][0])
+        if len(stack) == 1 and stack[0][0] != self.MOVING:
+            del self.stacks[index]
+        return removed
+
+    def push_layer(self, x: int, y: int, layer) -> None:
+        """
+        Puts `layer` on top of tile (x, y)
+        """
+        self._push(self._index(x, y), self._number(layer), layer)
+        self._changed(int(x), int(y))
+
+    def pop_layer(self, x: int, y: int):
+        """
+        Takes the top layer off tile (x, y) and returns it
+        """
+        layer = self._pop(self._index(x, y))
+        self._changed(int(x), int(y))
+        return layer
+
+    def top_layer(self, x: int, y: int):
+        index = self._index(x, y)
+        stack = self.stacks.get(index)
+        if stack is not None:
+            return stack[-1][1]
+        return self.layer_values[self.top_layers[index]]
+
+    def layers(self, x: int, y: int) -> list:
+        """
+        Every layer of tile (x, y), from the bottom up
+        """
+        index = self._index(x, y)
+        stack = self.stacks.get(index)
+        if stack is not None:
+            return [layer for _, layer in stack]
+        return [self.layer_values[self.top_layers[index]]]
+
+    def set_layers(self, x: int, y: int, layers: list) -> None:
+        """
+        Replaces every layer of tile (x, y), `layers` go from the bottom up.
+        No layers leaves the tile with `base`.
+        """
+        index = self._index(x, y)
+        # Moving barriers are the layers with a position
+        stack = [(self.MOVING if hasattr(layer, "position") else self._number(layer), layer) for layer in layers]
+        if not stack:
+            stack = [(self._number(self.base), self.base)]
+        if len(stack) > 1 or stack[0][0] == self.MOVING:
+            self.stacks[index] = stack
+        else:
+            self.stacks.pop(index, None)
+        self._set_top(index, stack[-1][0])
+        self._changed(int(x), int(y))
+
+    def passable(self, movelist) -> bytearray:
+        """
+        Returns a mask with a 1 for every tile whose top layer is in `movelist`,
+        in the same layout as `top_layers`.
+
+        The mask is built once per movelist and kept up to date as layers change.
+        """
+        allowed = frozenset(movelist)
+        mask = self.masks.get(allowed)
+        if mask is None:
+            values = self.layer_values
+            table = bytes(i < len(values) and values[i] in allowed for i in range(256))
+            mask = self.masks[allowed] = bytearray(self.top_layers).translate(table)
+        return mask
+
+    def walkable(self, movelist):
+        """
+        Returns a function that tells if the top layer at (x, y) can be walked on
+        """
+        mask = self.passable(movelist)
+        left = self.left
+        bottom = self.bottom
+        columns = self.right - left + 1
+        rows = self.top - bottom + 1
+        def check(x, y):
+            x -= left
+            y -= bottom
+            if x < 0 or y < 0 or x >= columns or y >= rows:
+                return False
+            return mask[x*rows + y]
+        return check
+
+    def _value(self, x, y):
+        return self.top_layer(x, y)
+
+    def _sections(self):
+        top_layers = bytearray(self.top_layers)
+        tiles = array("I")
+        sizes = array("I")
+        layers = array("B")
+        for index, stack in self.stacks.items():
+            # Moving barriers are left out
+            numbers = [number for number, _ in stack if number != self.MOVING] or [self.layer_ids[self.base]]
+            top_layers[index] = numbers[-1]
+            if len(numbers) > 1:
+                tiles.append(index)
+                sizes.append(len(numbers))
+                layers.extend(numbers)
+        meta = {"left": self.left, "right": self.right, "bottom": self.bottom, "top": self.top,
+                "base": self.base, "layers": self.layer_values}
+        return meta, {"top_layers": top_layers, "stack_tiles": tiles, "stack_sizes": sizes, "stack_layers": layers}
+
+    def _restore(self, meta, sections) -> None:
+        self._restore_bounds(meta)
+        self.layer_values = values = meta["layers"]
+        self.layer_ids = {layer: number for number, layer in enumerate(values)}
+        self.top_layers = sections["top_layers"]  # A memoryview of the file, not a bytearray
+        self.masks = {}
+        self.stacks = {}
+        layers = sections["stack_layers"]
+        position = 0
+        for index, size in zip(sections["stack_tiles"], sections["stack_sizes"]):
+            self.stacks[index] = [(number, values[number]) for number in layers[position:position + size]]
+            position += size
+
+    def _values(self):
+        # Moving barriers never match a movelist
+        values = self.layer_values + [object()]*(256 - len(self.layer_values))
+        return map(values.__getitem__, self.top_layers)
+
+    def _place(self, barrier, x, y):
+        self._push(self._index(x, y), self.MOVING, barrier)
+
+    def _vacate(self, barrier, x, y):
+        self._pop(self._index(x, y), barrier)
+
+    def push(self, barrier):
+        """
+        Puts `barrier` on top of whatever is on its tile
+        """
         x, y = collapse(barrier.position, self.tilesize)
-        self.barrier_dict[x][y].push(barrier)
+        self._push(self._index(x, y), self.MOVING, barrier)
+        self._changed(x, y)
 
     def remove(self, barrier: Union[int, Point, BarrierType]):
+        """
+        Removes a moving barrier by its index, the top of a tile,
+        or a barrier object from whichever layer it is on
+        """
         if isinstance(barrier, int):
-            barrier = self.moving_barriers.pop(int)
-            self.barrier_dict[barrier.center_x][barrier.center_y]
+            barrier = self.moving_barriers.pop(barrier)
+            self._forget(barrier)
             return barrier
-        elif isinstance(barrier, Point):
-            return self.barrier_dict[barrier[0]][barrier[1]].remove_top()
-        else:
-            return self.barrier_dict[barrier.center_x][barrier.center_y].remove(barrier)
+        elif isinstance(barrier, tuple):
+            return self.pop_layer(*barrier)
+        elif id(barrier) in self.placed:
+            self.moving_barriers.remove(barrier)
+            self._forget(barrier)
+            return barrier
+
+        x, y = collapse(barrier.position, self.tilesize)
+        self._changed(x, y)
+        return self._pop(self._index(x, y), barrier)
+
+
+class ChunkMap(TrackedMap):
+    """
+    Map for big open worlds where most tiles are `base`.
+
+    The world is split into square chunks of `chunk_size` tiles a side, kept
+    in a dict by chunk coordinate `(x >> shift, y >> shift)`. A chunk is only
+    made the first time one of its tiles is set to something else than
+    `base`, chunks that were never made read as `base`. Every chunk is one
+    flat array like `ArrayMap.tiles`, tile (x, y) at
+    `(x % chunk_size)*chunk_size + y % chunk_size`.
+
+    At most `max_chunks` chunks are kept in memory. When one more is needed,
+    the one used longest ago is written to `store` (a temporary file unless
+    a filename is given) and read back the next time it is used.
+    Searches only load the chunks they walk through, use the dict
+    functions (`AStarWDict`, `SearchAroundWDict`, ...) on it.
+    Component indexes and cost grids cover every tile in the bounds,
+    only track them on worlds small enough to label in full.
+    """
+
+    __slots__ = (
+        "tilesize",
+        "left",
+        "bottom",
+        "right",
+        "top",
+        "length",
+        "height",
+        "base",
+        "typecode",
+        "chunk_size",
+        "shift",
+        "max_chunks",
+        "chunks",
+        "saved",
+        "stored",
+        "store",
+        "store_name",
+        "version",
+        "changes",
+        "components",
+        "cost_grids",
+        "__weakref__"
+    )
+
+    def __init__(self,
+                 tilesize: int,
+                 left: int,
+                 right: int,
+                 bottom: int,
+                 top: int,
+                 base: int = 0,
+                 chunk_size: int = 64,
+                 max_chunks: Optional[int] = 1024,
+                 typecode: str = "B",
+                 store: Optional[str] = None
+                 ):
+        """
+        :param int tilesize: Size of the grid, in pixels
+        :param int left: Left border of the world, in pixels
+        :param int right: Right border of the world
+        :param int bottom: Bottom of the world
+        :param int top: Top of the world
+        :param int base: Value of every tile that was never set
+        :param int chunk_size: Tiles along a side of a chunk, a power of 2
+        :param int max_chunks: Chunks kept in memory before the oldest is
+            written to `store`, at least 1, None to keep them all
+        :param str store: File to write chunks to when they leave memory,
+            a temporary file by default
+        """
+        if chunk_size < 1 or chunk_size & (chunk_size - 1):
+            raise ValueError("chunk_size has to be a power of 2, not %d" % chunk_size)
+        if max_chunks is not None and max_chunks < 1:
+            # A new chunk would be evicted before the write to it
+            raise ValueError("max_chunks has to be at least 1, not %d" % max_chunks)
+        self.tilesize = tilesize
+        self.left = int(left // tilesize)
+        self.right = int(right // tilesize)
+        self.bottom = int(bottom // tilesize)
+        self.top = int(top // tilesize)
+        self.length = self.right - self.left + 1
+        self.height = self.top - self.bottom + 1
+        self.base = base
+        self.typecode = typecode
+        self.chunk_size = chunk_size
+        self.shift = chunk_size.bit_length() - 1
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()  # (cx, cy) -> array, least recently used first
+        self.saved = {}  # (cx, cy) -> memoryview, chunks of the file `load` opened
+        self.stored = {}  # (cx, cy) -> offset of the chunk in `store`
+        self.store = None  # Opened on the first eviction
+        self.store_name = store
+        self.version = 0  # Goes up every time the map is changed
+        self.changes = deque(maxlen=self.max_changes)
+        self.components = {}  # ComponentIndex per (movelist, diagonal)
+        self.cost_grids = {}  # [version, cost of every tile] per (movelist, costs)
+
+    def _read(self, key):
+        """
+        Chunk `key` from memory, the store or the saved file, without making
+        it recently used. None if it was never made.
+        """
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            return chunk
+        offset = self.stored.get(key)
+        if offset is not None:
+            chunk = array(self.typecode)
+            self.store.seek(offset)
+            chunk.fromfile(self.store, self.chunk_size*self.chunk_size)
+            return chunk
+        view = self.saved.get(key)
+        if view is not None:
+            return array(self.typecode, view)
+        return None
+
+    def _chunk(self, cx: int, cy: int, create: bool=False):
+        """
+        Chunk (cx, cy), loaded into memory, made if `create` is True
+        and it does not exist, None if it does not
+        """
+        key = (cx, cy)
+        chunks = self.chunks
+        chunk = chunks.get(key)
+        if chunk is not None:
+            chunks.move_to_end(key)
+            return chunk
+        chunk = self._read(key)
+        if chunk is None:
+            if not create:
+                return None
+            chunk = array(self.typecode, [self.base])*(self.chunk_size*self.chunk_size)
+        chunks[key] = chunk
+        if self.max_chunks is not None and len(chunks) > self.max_chunks:
+            self._evict()
+        return chunk
+
+    def _evict(self) -> None:
+        """
+        Writes the least recently used chunk to the store and drops it from memory
+        """
+        key, chunk = self.chunks.popitem(last=False)
+        offset = self.stored.get(key)
+        if offset is None:
+            if chunk.count(self.base) == len(chunk):
+                self.saved.pop(key, None)  # Back to base, nothing to keep
+                return
+            if self.store is None:
+                self.store = open(self.store_name, "w+b") if self.store_name else tempfile.TemporaryFile()
+            offset = self.stored[key] = self.store.seek(0, 2)
+        self.store.seek(offset)
+        chunk.tofile(self.store)
+
+    def close(self) -> None:
+        """
+        Closes the store, chunks that were evicted are lost
+        """
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        self.stored.clear()
+
+    def change(self, x: int, y: int, barrier: int) -> None:
+        x = int(x/self.tilesize)
+        y = int(y/self.tilesize)
+        if x < self.left or y < self.bottom or x > self.right or y > self.top:
+            raise IndexError("Tile (%d, %d) is outside the map" % (x, y))
+        shift = self.shift
+        mask = self.chunk_size - 1
+        chunk = self._chunk(x >> shift, y >> shift, barrier != self.base)
+        if chunk is not None:
+            chunk[(x & mask) << shift | y & mask] = barrier
+        self._changed(x, y)
+
+    def _reader(self, price):
+        """
+        Function that returns `price(tile)` for the tile at (x, y), 0 off the map.
+        Only loads the chunk when the search moves into another one.
+        """
+        left, bottom, right, top = self.bounds()
+        shift = self.shift
+        mask = self.chunk_size - 1
+        get = self._chunk
+        outside = price(self.base)
+        if self.typecode == "B":
+            price = [price(value) for value in range(256)].__getitem__
+
+        # Chunk the last tile was in, looked up again after any change to the map
+        cx = cy = None
+        chunk = None
+        version = None
+        def check(x, y):
+            nonlocal cx, cy, chunk, version
+            if x < left or y < bottom or x >= right or y >= top:
+                return 0
+            if x >> shift != cx or y >> shift != cy or version != self.version:
+                cx = x >> shift
+                cy = y >> shift
+                version = self.version
+                chunk = get(cx, cy)
+            if chunk is None:
+                return outside
+            return price(chunk[(x & mask) << shift | y & mask])
+        return check
+
+    def walkable(self, movelist):
+        """
+        Returns a function that tells if the tile at (x, y) can be walked on
+        """
+        allowed = frozenset(movelist)
+        return self._reader(allowed.__contains__)
+
+    def weighted(self, movelist, costs):
+        """
+        Like `walkable`, but the function returns the cost of stepping onto
+        (x, y), 0 if it can not be walked on. Prices come from the tile
+        values, no `cost_grid` of the whole world is made.
+        """
+        if min(costs.values(), default=1) < self.min_cost:
+            raise ValueError("Tile costs below %s make the heuristic overestimate" % self.min_cost)
+        allowed = frozenset(movelist)
+        return self._reader(lambda value: costs.get(value, 1) if value in allowed else 0)
+
+    def bounds(self):
+        """
+        (left, bottom, right, top) in tiles, right and top are exclusive
+        """
+        return (self.left, self.bottom, self.right + 1, self.top + 1)
+
+    def _value(self, x, y):
+        chunk = self._chunk(x >> self.shift, y >> self.shift)
+        if chunk is None:
+            return self.base
+        mask = self.chunk_size - 1
+        return chunk[(x & mask) << self.shift | y & mask]
+
+    def _values(self):
+        for x in range(self.left, self.right + 1):
+            for y in range(self.bottom, self.top + 1):
+                yield self._value(x, y)
 
+    def _sections(self):
+        keys = []
+        tiles = array(self.typecode)
+        for key in set(self.chunks).union(self.stored, self.saved):
+            chunk = self._read(key)
+            if chunk.count(self.base) != len(chunk):
+                keys.append(list(key))
+                tiles.extend(chunk)
+        meta = {"left": self.left, "right": self.right, "bottom": self.bottom, "top": self.top,
+                "base": self.base, "chunk_size": self.chunk_size, "max_chunks": self.max_chunks,
+                "chunks": keys}
+        return meta, {"tiles": tiles}
 
-#USE Weak refs(arcade as example)
\ No newline at end of file
+    def _restore(self, meta, sections) -> None:
+        self.left = meta["left"]
+        self.right = meta["right"]
+        self.bottom = meta["bottom"]
+        self.top = meta["top"]
+        self.length = self.right - self.left + 1
+        self.height = self.top - self.bottom + 1
+        self.base = meta["base"]
+        self.chunk_size = size = meta["chunk_size"]
+        self.shift = size.bit_length() - 1
+        self.max_chunks = meta["max_chunks"]
+        self.chunks = OrderedDict()
+        self.stored = {}
+        self.store = None
+        self.store_name = None
+        # Chunks are copied out of the mapped file the first time they are used
+        tiles = sections["tiles"]
+        self.typecode = tiles.format
+        area = size*size
+        self.saved = {tuple(key): tiles[i*area:(i + 1)*area] for i, key in enumerate(meta["chunks"])}
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import mmap
+import struct
+import multiprocessing
+from array import array
+from bisect import bisect_right
+from heapq import heappush, heappop
+from typing import Optional
+from customtypes import Point
+from pathfindingfuncs import move_cost
+from pathfinding import _adjacent, _format, _rounding, DIAGONAL_SQUARES
+
+
+__all__ = (
+    "FirstMoveTable",
+)
+
+
+# magic, format, left, bottom, width, height, diagonal, rounded, tilesize
+HEADER = struct.Struct("=4sIiiIIIId")
+HEADER_SIZE = 40
+MAGIC = b"FMT\x00"
+FORMAT = 2
+
+NONE = 15  # No path, in place of a move
+
+
+# Set in every worker process by `_start`
+_state = None
+
+
+def _start(mask, width, height, allow_diagonal_movement) -> None:
+    moves = [(dx, dy, move_cost((0, 0), (dx, dy)), DIAGONAL_SQUARES.index((dx, dy)))
+             for dx, dy in _adjacent(allow_diagonal_movement)]
+    global _state
+    _state = (mask, width, height, moves)
+
+
+def _row(source: int) -> array:
+    """
+    First move from `source` towards every tile, run-length encoded as
+    `target << 4 | move`, one entry where the move changes.
+    Walls are never a target, so they go with whatever run they are in.
+    """
+    mask, width, height, moves = _state
+    size = width*height
+    G = [float("inf")]*size
+    first = bytearray([NONE])*size
+
+    G[source] = 0
+    open_heap = [(0, source)]
+    while open_heap:
+        g, current = heappop(open_heap)
+        if g > G[current]:
+            continue  # Stale entry
+        x, y = divmod(current, height)
+        via = first[current]
+        for dx, dy, cost, move in moves:
+            nx = x + dx
+            ny = y + dy
+            if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                continue
+            neighbour = nx*height + ny
+            if not mask[neighbour]:
+                continue
+            candidate_g = g + cost
+            if candidate_g < G[neighbour]:
+                G[neighbour] = candidate_g
+                first[neighbour] = move if current == source else via
+                heappush(open_heap, (candidate_g, neighbour))
+
+    runs = array("I")
+    last = None
+    for target in range(size):
+        if not mask[target] or target == source:
+            continue
+        move = first[target]
+        if move != last:
+            runs.append(target << 4 | move)
+            last = move
+    if runs:
+        runs[0] &= 15  # The first run starts at the first tile
+    return runs
+
+
+def _rows(sources: range) -> array:
+    runs = array("I")
+    counts = array("I")
+    for source in sources:
+        row = _row(source)
+        counts.append(len(row))
+        runs.extend(row)
+    return counts, runs
+
+
+class FirstMoveTable:
+    """
+    Compressed first-move table (CPD) for a map that does not change:
+    for every pair of tiles, the first step of a shortest path between them.
+
+    A path is read off one step at a time with no search, so a query costs
+    O(path length). Paths are as short as `AStarSearch`'s.
+    `FirstMoveTable.build` precomputes it into a file, one Dijkstra per
+    tile spread over all cores, and `FirstMoveTable.load` maps that file
+    into memory with `mmap`.
+
+    Every tile has a row of runs, `target << 4 | move` where `target` is the
+    flat index `(x - left)*height + (y - bottom)` the run starts at and `move`
+    an index into `DIAGONAL_SQUARES` (15 for no path).
+
+    ... Example:
+        FirstMoveTable.build(Map, "level1.fmt", movelist=[0])   # once, offline
+        table = FirstMoveTable.load("level1.fmt")
+        path = table.path(start, end)
+    """
+
+    __slots__ = (
+        "memory",
+        "left",
+        "bottom",
+        "width",
+        "height",
+        "allow_diagonal_movement",
+        "rounded",
+        "tilesize",
+        "mask",
+        "offsets",
+        "runs"
+    )
+
+    def __init__(self, memory: mmap.mmap):
+        """
+        Use `FirstMoveTable.load` instead
+        """
+        magic, version, left, bottom, width, height, diagonal, rounded, tilesize = HEADER.unpack_from(memory, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a first-move table")
+        if version != FORMAT:
+            raise ValueError("First-move table format %d, expected %d (or made with the other byte order)" % (version, FORMAT))
+        self.memory = memory
+        self.left = left
+        self.bottom = bottom
+        self.width = width
+        self.height = height
+        self.allow_diagonal_movement = bool(diagonal)
+        self.rounded = bool(rounded)  # Pixels are rounded to tiles like the map's searches do, not truncated
+        self.tilesize = int(tilesize) if tilesize.is_integer() else tilesize
+
+        size = width*height
+        view = memoryview(memory)
+        start = HEADER_SIZE
+        self.mask = view[start:start + size]
+        start += -(-size//4)*4
+        self.offsets = view[start:start + 4*(size + 1)].cast("I")
+        start += 4*(size + 1)
+        self.runs = view[start:start + 4*self.offsets[size]].cast("I")
+
+    @classmethod
+    def build(cls, Map, filename: str, movelist=[], allow_diagonal_movement: bool=True,
+              processes: Optional[int] = None) -> FirstMoveTable:
+        """
+        Precomputes the table for `Map` into `filename` and loads it.
+        Takes one Dijkstra per tile, spread over `processes` workers (one per CPU by default).
+
+        :param Map: Map to precompute, it needs `walkable`, `bounds` and `tilesize`
+        """
+        left, bottom, right, top = Map.bounds()
+        width = right - left
+        height = top - bottom
+        size = width*height
+        walkable = Map.walkable(movelist)
+        mask = bytes(bool(walkable(left + i//height, bottom + i % height)) for i in range(size))
+
+        # A few chunks per worker so they all stay busy until the end
+        chunk = max(1, min(256, size//(4*(processes or multiprocessing.cpu_count()))))
+        chunks = [range(i, min(i + chunk, size)) for i in range(0, size, chunk)]
+
+        offsets = array("I", [0])
+        runs = array("I")
+        initargs = (mask, width, height, allow_diagonal_movement)
+        if processes == 1:
+            _start(*initargs)
+            results = map(_rows, chunks)
+        else:
+            pool = multiprocessing.Pool(processes, initializer=_start, initargs=initargs)
+            results = pool.imap(_rows, chunks)
+        try:
+            for counts, chunk_runs in results:
+                for count in counts:
+                    offsets.append(offsets[-1] + count)
+                runs.extend(chunk_runs)
+        finally:
+            if processes != 1:
+                pool.close()
+                pool.join()
+
+        with open(filename, "wb") as file:
+            file.write(HEADER.pack(MAGIC, FORMAT, left, bottom, width, height,
+                                   allow_diagonal_movement, _rounding(Map) is round, Map.tilesize).ljust(HEADER_SIZE, b"\0"))
+            file.write(mask.ljust(-(-size//4)*4, b"\0"))
+            offsets.tofile(file)
+            runs.tofile(file)
+        return cls.load(filename)
+
+    @classmethod
+    def load(cls, filename: str) -> FirstMoveTable:
+        """
+        Maps a table made by `build` into memory, read only
+        """
+        with open(filename, "rb") as file:
+            memory = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(memory)
+
+    def _index(self, tile) -> int:
+        x = tile[0] - self.left
+        y = tile[1] - self.bottom
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return -1
+        return x*self.height + y
+
+    def move(self, start, end) -> Optional[Point]:
+        """
+        First step (dx, dy) from tile `start` towards tile `end`, None if there is no path
+        """
+        source = self._index(start)
+        target = self._index(end)
+        if source < 0 or target < 0 or not self.mask[target] or source == target:
+            return None
+        runs = self.runs
+        lo = self.offsets[source]
+        hi = self.offsets[source + 1]
+        if lo == hi:
+            return None
+        position = max(lo, bisect_right(runs, target << 4 | 15, lo, hi) - 1)
+        move = runs[position] & 15
+        if move == NONE:
+            return None
+        return DIAGONAL_SQUARES[move]
+
+    def path_tiles(self, start, end) -> array:
+        """
+        Flat array of the tiles from tile `start` to tile `end`, empty if there is no path
+        """
+        tiles = array("i", start)
+        if start == end:
+            return tiles
+        current = start
+        for _ in range(self.width*self.height):
+            step = self.move(current, end)
+            if step is None:
+                return array("i")
+            current = (current[0] + step[0], current[1] + step[1])
+            tiles.append(current[0])
+            tiles.append(current[1])
+            if current == end:
+                return tiles
+        return array("i")
+
+    def path(self, start: Point, end: Point, output: str="list", first: Optional[int]=None):
+        """
+        Path from `start` to `end` in pixels, like `AStarSearch` returns it.
+        `output` and `first` work like in `AStarSearch`.
+        """
+        tilesize = self.tilesize
+        convert = round if self.rounded else int
+        start = (convert(start[0]/tilesize), convert(start[1]/tilesize))
+        end = (convert(end[0]/tilesize), convert(end[1]/tilesize))
+        return _format(self.path_tiles(start, end), tilesize, output, first)
+
+    def close(self) -> None:
+        self.mask.release()
+        self.offsets.release()
+        self.runs.release()
+        self.memory.close()
+
+    def __enter__(self) -> FirstMoveTable:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from customtypes import Point
+from typing import Optional, List
+from pathfindingfuncs import move_cost
+from pathfinding import _dijkstra, _adjacent, _to_tile
+
+
+__all__ = (
+    "FlowField",
+)
+
+
+class FlowField:
+    """
+    Distances and directions from every reachable tile to one goal.
+
+    Built with one search out from the goal, so any number of agents
+    chasing the same goal can read their next step or whole path
+    without searching again.
+    Works with every map that has `walkable` and `version`.
+    Positions are turned into tiles like the search function for the map
+    does. A goal that can not be walked on gives an empty field, nothing
+    can reach it, like `AStarSearch` returning `[]`.
+    An agent on a blocked tile (like a moving barrier) steps off it onto
+    the neighbour closest to the goal, like `AStarSearch` does.
+    """
+
+    __slots__ = (
+        "Map",
+        "goal",
+        "movelist",
+        "allow_diagonal_movement",
+        "version",
+        "distances",
+        "towards"
+    )
+
+    def __init__(self, Map, goal: Point, movelist=[], allow_diagonal_movement: bool=True):
+        """
+        :param Map: Map to search
+        :param Point goal: Position everything flows to, in pixels
+        :param movelist: Tiles that can be walked on
+        :param bool allow_diagonal_movement: Whether diagonal steps are allowed
+        """
+        self.Map = Map
+        self.movelist = movelist
+        self.allow_diagonal_movement = allow_diagonal_movement
+        self.goal = None
+        self.version = None
+        self.distances = {}
+        self.towards = {}
+
+        self.update(goal)
+
+    def _tile(self, position: Point):
+        return _to_tile(self.Map, position)
+
+    def update(self, goal: Optional[Point] = None) -> bool:
+        """
+        Rebuilds the field if the goal moved to another tile or the map changed.
+
+        Returns True if the field was rebuilt.
+        """
+        tile = self.goal if goal is None else self._tile(goal)
+        if tile == self.goal and self.version == self.Map.version:
+            return False
+
+        self.goal = tile
+        self.version = self.Map.version
+        walkable = self.Map.walkable(self.movelist)
+        if not walkable(*tile):
+            self.distances, self.towards = {}, {}
+            return True
+        self.distances, self.towards = _dijkstra(
+            walkable, [tile], _adjacent(self.allow_diagonal_movement)
+        )
+        return True
+
+    def distance(self, position: Point) -> Optional[float]:
+        """
+        Movement cost from `position` to the goal, None if it cannot be reached
+        """
+        self.update()
+        tile = self._tile(position)
+        if tile in self.distances:
+            return self.distances[tile]
+        step = self._step_off(tile)
+        return step[0] if step is not None else None
+
+    def _step_off(self, tile):
+        """
+        (cost to the goal, neighbour) for leaving a tile that is not in the
+        field, through its cheapest neighbour. None if none of them is in it.
+        """
+        walkable = self.Map.walkable(self.movelist)
+        distances = self.distances
+        best = None
+        for dx, dy in _adjacent(self.allow_diagonal_movement):
+            neighbour = (tile[0] + dx, tile[1] + dy)
+            if neighbour in distances and walkable(neighbour[0], neighbour[1]):
+                cost = distances[neighbour] + move_cost(tile, neighbour)
+                if best is None or cost < best[0]:
+                    best = (cost, neighbour)
+        return best
+
+    def next_step(self, position: Point) -> Optional[Point]:
+        """
+        Next position to move to, the goal itself once there,
+        None if the goal cannot be reached
+        """
+        self.update()
+        tilesize = self.Map.tilesize
+        current = self._tile(position)
+        if not current in self.distances:
+            step = self._step_off(current)
+            if step is None:
+                return None
+            current = step[1]
+        else:
+            current = self.towards.get(current, current)
+        return [current[0]*tilesize, current[1]*tilesize]
+
+    def path(self, position: Point) -> List[Point]:
+        """
+        Same format as `AStarSearch`, starts on `position` and ends on the goal
+        """
+        self.update()
+        tilesize = self.Map.tilesize
+        current = self._tile(position)
+        path = [[current[0]*tilesize, current[1]*tilesize]]
+        if not current in self.distances:
+            step = self._step_off(current)
+            if step is None:
+                return []
+            current = step[1]
+            path.append([current[0]*tilesize, current[1]*tilesize])
+
+        towards = self.towards
+        while current in towards:
+            current = towards[current]
+            path.append([current[0]*tilesize, current[1]*tilesize])
+        return path
@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+from customtypes import Point
+from typing import Optional, List, Iterable, Iterator
+from heapq import heappush, heappop
+from pathfindingfuncs import heuristic, move_cost
+from pathfinding import _astar, _dijkstra, _adjacent, _to_tile
+
+
+__all__ = (
+    "HierarchicalMap",
+)
+
+
+class HierarchicalMap:
+    """
+    HPA* layer over a map, for big maps where even a fast A* visits too many tiles.
+
+    The map is split into square clusters. Tiles where a path can cross from
+    one cluster into the next become nodes of a small abstract graph, and the
+    distances between the nodes of each cluster are precomputed. Queries are
+    answered on the abstract graph first and only refined to tiles inside the
+    clusters the route goes through.
+    Paths are close to, but not always exactly, as short as `AStarSearch`.
+    """
+
+    __slots__ = (
+        "Map",
+        "movelist",
+        "allow_diagonal_movement",
+        "adjacent_squares",
+        "cluster_size",
+        "lazy",
+        "walkable",
+        "version",
+        "left",
+        "bottom",
+        "right",
+        "top",
+        "borders",
+        "nodes",
+        "edges",
+        "dirty"
+    )
+
+    def __init__(self, Map, movelist=[], allow_diagonal_movement: bool=True,
+                 cluster_size: int=16, lazy: bool=False):
+        """
+        :param Map: Map to build over, it needs `walkable`, `bounds`, `version` and `changed_since`
+        :param movelist: Tiles that can be walked on
+        :param bool allow_diagonal_movement: Whether diagonal steps are allowed
+        :param int cluster_size: Width and height of a cluster, in tiles
+        :param bool lazy: Only work out the distances inside a cluster
+            the first time a query needs them
+        """
+        self.Map = Map
+        self.movelist = movelist
+        self.allow_diagonal_movement = allow_diagonal_movement
+        self.adjacent_squares = _adjacent(allow_diagonal_movement)
+        self.cluster_size = cluster_size
+        self.lazy = lazy
+        self.build()
+
+    def cluster(self, tile):
+        size = self.cluster_size
+        return ((tile[0] - self.left)//size, (tile[1] - self.bottom)//size)
+
+    def _in_cluster(self, cluster):
+        size = self.cluster_size
+        x0 = self.left + cluster[0]*size
+        y0 = self.bottom + cluster[1]*size
+        x1 = min(x0 + size, self.right)
+        y1 = min(y0 + size, self.top)
+        walkable = self.walkable
+        def check(x, y):
+            return x0 <= x < x1 and y0 <= y < y1 and walkable(x, y)
+        return check
+
+    def _clusters(self):
+        size = self.cluster_size
+        for cx in range((self.right - self.left + size - 1)//size):
+            for cy in range((self.top - self.bottom + size - 1)//size):
+                yield (cx, cy)
+
+    def build(self) -> None:
+        """
+        Builds the whole abstract graph from scratch
+        """
+        self.walkable = self.Map.walkable(self.movelist)
+        self.version = self.Map.version
+        self.left, self.bottom, self.right, self.top = self.Map.bounds()
+
+        self.borders = {}  # (cluster, cluster) -> [(tile, tile), ...]
+        self.nodes = {}  # cluster -> set of tiles
+        self.edges = {}  # cluster -> {tile: {tile: cost}}
+        self.dirty = set()
+
+        clusters = list(self._clusters())
+        for cluster in clusters:
+            for other in self._next_to(cluster):
+                if other > cluster:
+                    self._build_border(cluster, other)
+        for cluster in clusters:
+            self._collect_nodes(cluster)
+            self.dirty.add(cluster)
+        if not self.lazy:
+            for cluster in clusters:
+                self._cluster_edges(cluster)
+
+    def _next_to(self, cluster):
+        size = self.cluster_size
+        width = (self.right - self.left + size - 1)//size
+        height = (self.top - self.bottom + size - 1)//size
+        for dx, dy in self.adjacent_squares:
+            other = (cluster[0] + dx, cluster[1] + dy)
+            if 0 <= other[0] < width and 0 <= other[1] < height:
+                yield other
+
+    def _build_border(self, a, b) -> None:
+        """
+        Finds where a path can cross from cluster `a` into cluster `b`
+        """
+        walkable = self.walkable
+        size = self.cluster_size
+        dx = b[0] - a[0]
+        dy = b[1] - a[1]
+        pairs = []
+
+        if dx and dy:
+            # Clusters only touching at a corner
+            x = self.left + a[0]*size + (size - 1 if dx > 0 else 0)
+            y = self.bottom + a[1]*size + (size - 1 if dy > 0 else 0)
+            if walkable(x, y) and walkable(x + dx, y + dy):
+                pairs.append(((x, y), (x + dx, y + dy)))
+            self.borders[(a, b)] = pairs
+            return
+
+        # Walk along the shared edge, (x, y) is in `a`, one step of (dx, dy) is in `b`
+        if dx:
+            x = self.left + a[0]*size + (size - 1 if dx > 0 else 0)
+            edge = [(x, y) for y in range(self.bottom + a[1]*size, min(self.bottom + (a[1] + 1)*size, self.top))]
+            along = (0, 1)
+        else:
+            y = self.bottom + a[1]*size + (size - 1 if dy > 0 else 0)
+            edge = [(x, y) for x in range(self.left + a[0]*size, min(self.left + (a[0] + 1)*size, self.right))]
+            along = (1, 0)
+
+        straight = [walkable(x, y) and walkable(x + dx, y + dy) for x, y in edge]
+
+        # One crossing in the middle of every open stretch of the edge
+        run = []
+        for tile, crossing in zip(edge + [None], straight + [False]):
+            if crossing:
+                run.append(tile)
+            elif run:
+                x, y = run[len(run)//2]
+                pairs.append(((x, y), (x + dx, y + dy)))
+                run = []
+
+        if self.allow_diagonal_movement:
+            # Diagonal crossings only matter if neither side can cross straight
+            crossing = set(tile for tile, open in zip(edge, straight) if open)
+            on_edge = set(edge)
+            for x, y in edge:
+                if (x, y) in crossing or not walkable(x, y):
+                    continue
+                for step in (-1, 1):
+                    ox = x + dx + along[0]*step
+                    oy = y + dy + along[1]*step
+                    if (ox - dx, oy - dy) in crossing or not (ox - dx, oy - dy) in on_edge:
+                        continue
+                    if walkable(ox, oy):
+                        pairs.append(((x, y), (ox, oy)))
+
+        self.borders[(a, b)] = pairs
+
+    def _collect_nodes(self, cluster) -> None:
+        nodes = set()
+        for other in self._next_to(cluster):
+            if other > cluster:
+                for tile, _ in self.borders[(cluster, other)]:
+                    nodes.add(tile)
+            else:
+                for _, tile in self.borders[(other, cluster)]:
+                    nodes.add(tile)
+        self.nodes[cluster] = nodes
+
+    def _cluster_edges(self, cluster):
+        """
+        Distances between the nodes of `cluster`, staying inside it
+        """
+        if cluster in self.dirty:
+            inside = self._in_cluster(cluster)
+            nodes = sorted(self.nodes[cluster])
+            edges = {node: {} for node in nodes}
+            # Distances are the same both ways, so each pair is only searched once
+            for i, node in enumerate(nodes[:-1]):
+                later = nodes[i + 1:]
+                G, _ = _dijkstra(inside, [node], self.adjacent_squares, later)
+                for other in later:
+                    if other in G:
+                        edges[node][other] = edges[other][node] = G[other]
+            self.edges[cluster] = edges
+            self.dirty.discard(cluster)
+        return self.edges[cluster]
+
+    def _crossings(self, tile):
+        """
+        Steps from `tile` straight into another cluster
+        """
+        cluster = self.cluster(tile)
+        for other in self._next_to(cluster):
+            if other > cluster:
+                for a, b in self.borders[(cluster, other)]:
+                    if a == tile:
+                        yield b
+            else:
+                for b, a in self.borders[(other, cluster)]:
+                    if a == tile:
+                        yield b
+
+    def update(self, changed: Optional[Iterable] = None) -> None:
+        """
+        Rebuilds only the clusters around tiles that changed.
+
+        :param changed: Tiles that changed, if not given they are read
+            from the map's change log
+        """
+        if changed is None:
+            changed = self.Map.changed_since(self.version)
+            if changed is None:
+                self.build()
+                return
+        self.version = self.Map.version
+
+        touched = set()
+        for tile in changed:
+            cluster = self.cluster(tile)
+            touched.add(cluster)
+            # Tiles on (or next to) an edge change the crossings into the neighbours
+            for dx, dy in self.adjacent_squares:
+                other = self.cluster((tile[0] + dx, tile[1] + dy))
+                if other != cluster and other in self.nodes:
+                    touched.add(other)
+
+        rebuild = set()
+        for cluster in touched:
+            if not cluster in self.nodes:
+                continue
+            for other in self._next_to(cluster):
+                if other in touched:
+                    self._build_border(min(cluster, other), max(cluster, other))
+            rebuild.add(cluster)
+        for cluster in rebuild:
+            self._collect_nodes(cluster)
+            self.dirty.add(cluster)
+            if not self.lazy:
+                self._cluster_edges(cluster)
+
+    def abstract_path(self, start: Point, end: Point) -> List:
+        """
+        Tiles the route goes through on the abstract graph, from start to end
+        """
+        if self.version != self.Map.version:
+            self.update()
+
+        return self._abstract(_to_tile(self.Map, start), _to_tile(self.Map, end))
+
+    def _hook(self, tile, cluster, end):
+        """
+        Costs from `tile` to the nodes of `cluster` (and `end`, if it is in there)
+        """
+        targets = self.nodes[cluster] | {end} if self.cluster(end) == cluster else self.nodes[cluster]
+        G, _ = _dijkstra(self._in_cluster(cluster), [tile], self.adjacent_squares, targets)
+        return {node: G[node] for node in targets if node in G}
+
+    def _abstract(self, start, end):
+        if start == end:
+            return [start]
+        if not self.walkable(end[0], end[1]):
+            return []
+
+        start_cluster = self.cluster(start)
+        end_cluster = self.cluster(end)
+        if not start_cluster in self.nodes or not end_cluster in self.nodes:
+            return []
+
+        # Hook start and end onto the nodes of their clusters
+        from_start = self._hook(start, start_cluster, end)
+        via = {}
+        for dx, dy in self.adjacent_squares:
+            # Like `AStarSearch`, the first step may go straight into another cluster
+            tile = (start[0] + dx, start[1] + dy)
+            cluster = self.cluster(tile)
+            if cluster == start_cluster or not cluster in self.nodes or not self.walkable(tile[0], tile[1]):
+                continue
+            step = move_cost(start, tile)
+            for node, cost in self._hook(tile, cluster, end).items():
+                if step + cost < from_start.get(node, float("inf")):
+                    from_start[node] = step + cost
+                    via[node] = tile
+        from_start.pop(start, None)
+
+        G, _ = _dijkstra(self._in_cluster(end_cluster), [end], self.adjacent_squares, self.nodes[end_cluster])
+        to_end = {node: G[node] for node in self.nodes[end_cluster] if node in G}
+
+        G = {start: 0}
+        came_from = {}
+        closed_vertices = set()
+        counter = 0
+        open_heap = [(heuristic(start, end), counter, start)]
+        while open_heap:
+            current = heappop(open_heap)[2]
+            if current in closed_vertices:
+                continue
+            if current == end:
+                path = [current]
+                while current in came_from:
+                    previous = came_from[current]
+                    if previous == start and current in via:
+                        path.append(via[current])
+                    current = previous
+                    path.append(current)
+                path.reverse()
+                return path
+            closed_vertices.add(current)
+
+            if current == start:
+                neighbours = list(from_start.items())
+            else:
+                neighbours = list(self._cluster_edges(self.cluster(current))[current].items())
+                for other in self._crossings(current):
+                    neighbours.append((other, move_cost(current, other)))
+                if current in to_end:
+                    neighbours.append((end, to_end[current]))
+
+            for neighbour, cost in neighbours:
+                if neighbour in closed_vertices:
+                    continue
+                candidate_g = G[current] + cost
+                if neighbour in G and candidate_g >= G[neighbour]:
+                    continue
+                came_from[neighbour] = current
+                G[neighbour] = candidate_g
+                counter += 1
+                heappush(open_heap, (candidate_g + heuristic(neighbour, end), counter, neighbour))
+        return []
+
+    def _refine(self, abstract) -> Iterator:
+        """
+        Turns consecutive abstract tiles into the tiles in between, one leg at a time
+        """
+        tilesize = self.Map.tilesize
+        yield [abstract[0][0]*tilesize, abstract[0][1]*tilesize]
+        for a, b in zip(abstract, abstract[1:]):
+            if self.cluster(a) != self.cluster(b):
+                yield [b[0]*tilesize, b[1]*tilesize]  # Crossing into the next cluster
+                continue
+            size = self.cluster_size
+            leg = _astar(self._in_cluster(self.cluster(a)), a, b, self.adjacent_squares, size*size, 1, 0)
+            for i in range(2, len(leg), 2):
+                yield [leg[i]*tilesize, leg[i + 1]*tilesize]
+
+    def path(self, start: Point, end: Point, lazy: bool=False):
+        """
+        Same format as `AStarSearch`.
+
+        With `lazy` it gives back an iterator that only refines the next
+        leg of the route when it is reached.
+        """
+        abstract = self.abstract_path(start, end)
+        if not abstract:
+            return iter(()) if lazy else []
+        refined = self._refine(abstract)
+        return refined if lazy else list(refined)
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from customtypes import Point
+from typing import Optional, List, Iterable
+from heapq import heappush, heappop
+from pathfindingfuncs import heuristic, move_cost
+from pathfinding import _adjacent, _to_tile
+
+
+__all__ = (
+    "IncrementalPlanner",
+)
+
+
+INF = float("inf")
+
+
+class IncrementalPlanner:
+    """
+    D* Lite planner tied to one map and one goal.
+
+    After the map changes only the costs around the changed tiles are
+    repaired, instead of searching the whole map again.
+    Works with every map that has `walkable`, `version` and `changed_since`.
+
+    ... Example:
+        planner = IncrementalPlanner(Map, goal, movelist=[0])
+        path = planner.path(enemy.position)
+        Map.change(...)
+        path = planner.path(enemy.position)  # only repairs what changed
+    """
+
+    __slots__ = (
+        "Map",
+        "goal",
+        "movelist",
+        "adjacent_squares",
+        "walkable",
+        "version",
+        "start",
+        "km",
+        "G",
+        "rhs",
+        "queued",
+        "open_heap",
+        "counter"
+    )
+
+    def __init__(self, Map, goal: Point, movelist=[], allow_diagonal_movement: bool=True):
+        """
+        :param Map: Map to search
+        :param Point goal: Position every path ends at, in pixels
+        :param movelist: Tiles that can be walked on
+        :param bool allow_diagonal_movement: Whether diagonal steps are allowed
+        """
+        self.Map = Map
+        self.movelist = movelist
+        self.adjacent_squares = _adjacent(allow_diagonal_movement)
+        self.goal = self._tile(goal)
+        self.reset()
+
+    def _tile(self, position: Point):
+        return _to_tile(self.Map, position)
+
+    def reset(self) -> None:
+        """
+        Throws away everything found so far
+        """
+        self.walkable = self.Map.walkable(self.movelist)
+        self.version = self.Map.version
+        self.start = None
+        self.km = 0
+        self.G = {}
+        self.rhs = {self.goal: 0}
+        self.queued = {}
+        self.open_heap = []
+        self.counter = 0
+        self._queue(self.goal)
+
+    def _key(self, tile):
+        best = min(self.G.get(tile, INF), self.rhs.get(tile, INF))
+        if self.start is None:
+            return (best, best)
+        return (best + heuristic(self.start, tile) + self.km, best)
+
+    def _queue(self, tile) -> None:
+        key = self._key(tile)
+        self.queued[tile] = key
+        self.counter += 1
+        heappush(self.open_heap, (key, self.counter, tile))
+
+    def _cost(self, a, b) -> float:
+        if not self.walkable(b[0], b[1]):
+            return INF
+        return move_cost(a, b)
+
+    def _update_tile(self, tile) -> None:
+        # Blocked tiles are only ever needed as the place the agent stands on
+        if tile != self.start and not self.walkable(tile[0], tile[1]):
+            if tile in self.rhs and tile != self.goal:
+                del self.rhs[tile]
+            self.queued.pop(tile, None)
+            return
+
+        G = self.G
+        if tile != self.goal:
+            best = INF
+            for dx, dy in self.adjacent_squares:
+                neighbour = (tile[0] + dx, tile[1] + dy)
+                g = G.get(neighbour, INF)
+                if g == INF:
+                    continue
+                cost = self._cost(tile, neighbour) + g
+                if cost < best:
+                    best = cost
+            self.rhs[tile] = best
+
+        self.queued.pop(tile, None)
+        if G.get(tile, INF) != self.rhs.get(tile, INF):
+            self._queue(tile)
+
+    def _compute(self) -> None:
+        G = self.G
+        rhs = self.rhs
+        queued = self.queued
+        open_heap = self.open_heap
+        start = self.start
+        adjacent_squares = self.adjacent_squares
+
+        while open_heap:
+            key, _, tile = open_heap[0]
+            if queued.get(tile) != key:
+                heappop(open_heap)  # Stale entry
+                continue
+            if not (key < self._key(start) or rhs.get(start, INF) != G.get(start, INF)):
+                break
+
+            heappop(open_heap)
+            new_key = self._key(tile)
+            if key < new_key:
+                self._queue(tile)
+                continue
+
+            del queued[tile]
+            if G.get(tile, INF) > rhs.get(tile, INF):
+                G[tile] = rhs[tile]
+            else:
+                G[tile] = INF
+                self._update_tile(tile)
+
+            for dx, dy in adjacent_squares:
+                self._update_tile((tile[0] + dx, tile[1] + dy))
+
+    def update(self, changed: Optional[Iterable] = None) -> None:
+        """
+        Repairs the costs around tiles that changed.
+
+        :param changed: Tiles that changed, if not given they are read
+            from the map's change log
+        """
+        if changed is None:
+            changed = self.Map.changed_since(self.version)
+            if changed is None:
+                # The map's log does not reach back far enough
+                self.reset()
+                return
+        self.version = self.Map.version
+
+        for tile in changed:
+            self._update_tile(tile)
+            for dx, dy in self.adjacent_squares:
+                self._update_tile((tile[0] + dx, tile[1] + dy))
+
+    def path(self, start: Point) -> List[Point]:
+        """
+        Same format as `AStarSearch`, starts on `start` and ends on the goal
+        """
+        tile = self._tile(start)
+        if self.version != self.Map.version:
+            self.update()
+        if tile != self.start:
+            if self.start is not None:
+                self.km += heuristic(self.start, tile)
+            self.start = tile
+            self._update_tile(tile)
+
+        self._compute()
+
+        G = self.G
+        if G.get(tile, INF) == INF:
+            return []
+
+        tilesize = self.Map.tilesize
+        current = tile
+        path = [[current[0]*tilesize, current[1]*tilesize]]
+        for _ in range(len(G)):
+            if current == self.goal:
+                return path
+            best = None
+            best_cost = INF
+            for dx, dy in self.adjacent_squares:
+                neighbour = (current[0] + dx, current[1] + dy)
+                cost = self._cost(current, neighbour) + G.get(neighbour, INF)
+                if cost < best_cost:
+                    best_cost = cost
+                    best = neighbour
+            if best is None:
+                return []
+            current = best
+            path.append([current[0]*tilesize, current[1]*tilesize])
+        return []
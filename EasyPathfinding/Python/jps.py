@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+from customtypes import Point
+from typing import Optional
+from array import array
+from heapq import heappush, heappop
+from pathfindingfuncs import heuristic, move_cost
+from pathfinding import _search, _format, _to_tile, DIAGONAL_SQUARES
+from searchstats import SearchStats
+from smoothing import _string_pull
+
+
+__all__ = (
+    "JPSSearch",
+    "JumpTable",
+)
+
+
+def _directions(walkable, x, y, direction):
+    """
+    Directions worth jumping in after arriving at (x, y) going `direction`,
+    every other neighbour can be reached just as cheaply without going through (x, y)
+    """
+    if direction is None:
+        return DIAGONAL_SQUARES
+
+    dx, dy = direction
+    if dx and dy:
+        directions = [(dx, 0), (0, dy), (dx, dy)]
+        if not walkable(x - dx, y):
+            directions.append((-dx, dy))
+        if not walkable(x, y - dy):
+            directions.append((dx, -dy))
+    elif dx:
+        directions = [(dx, 0)]
+        if not walkable(x, y + 1):
+            directions.append((dx, 1))
+        if not walkable(x, y - 1):
+            directions.append((dx, -1))
+    else:
+        directions = [(0, dy)]
+        if not walkable(x + 1, y):
+            directions.append((1, dy))
+        if not walkable(x - 1, y):
+            directions.append((-1, dy))
+    return directions
+
+
+def _forced(walkable, x, y, dx, dy) -> bool:
+    """
+    True if arriving at (x, y) going (dx, dy) uncovers a neighbour
+    that can only be reached cheaply through (x, y)
+    """
+    if dx and dy:
+        return ((walkable(x - dx, y + dy) and not walkable(x - dx, y)) or
+                (walkable(x + dx, y - dy) and not walkable(x, y - dy)))
+    elif dx:
+        return ((walkable(x + dx, y + 1) and not walkable(x, y + 1)) or
+                (walkable(x + dx, y - 1) and not walkable(x, y - 1)))
+    return ((walkable(x + 1, y + dy) and not walkable(x + 1, y)) or
+            (walkable(x - 1, y + dy) and not walkable(x - 1, y)))
+
+
+def _jump(walkable, x, y, dx, dy, end):
+    """
+    Walks from (x, y) in direction (dx, dy) until it finds a jump point
+    """
+    while True:
+        if not walkable(x, y):
+            return None
+        if (x, y) == end or _forced(walkable, x, y, dx, dy):
+            return (x, y)
+        if dx and dy:
+            # A diagonal step is a jump point if a straight jump from it finds one
+            if _jump(walkable, x + dx, y, dx, 0, end) or _jump(walkable, x, y + dy, 0, dy, end):
+                return (x, y)
+        x += dx
+        y += dy
+
+
+class JumpTable:
+    """
+    Precomputed jump distances (JPS+) for a map that does not change.
+
+    For every tile and each of the 8 directions it stores how far away the
+    next jump point is (positive), or how many steps can be walked before a
+    wall (zero or negative).
+    The table is rebuilt if the map's version changes.
+    """
+
+    __slots__ = (
+        "Map",
+        "movelist",
+        "version",
+        "left",
+        "bottom",
+        "width",
+        "height",
+        "walkable",
+        "distances"
+    )
+
+    def __init__(self, Map, movelist=[]):
+        """
+        :param Map: Map to precompute, it needs `walkable`, `bounds` and `version`
+        :param movelist: Tiles that can be walked on
+        """
+        self.Map = Map
+        self.movelist = movelist
+        self.build()
+
+    def build(self) -> None:
+        Map = self.Map
+        left, bottom, right, top = Map.bounds()
+        width = right - left
+        height = top - bottom
+        walkable = Map.walkable(self.movelist)
+
+        self.version = Map.version
+        self.left = left
+        self.bottom = bottom
+        self.width = width
+        self.height = height
+        self.walkable = walkable
+        self.distances = distances = {}
+
+        # Straight directions come first, diagonal jump points depend on them
+        for dx, dy in DIAGONAL_SQUARES:
+            table = array("i", [0]) * (width * height)
+            distances[(dx, dy)] = table
+            straight = (distances.get((dx, 0)), distances.get((0, dy)))
+
+            xs = range(width - 1, -1, -1) if dx > 0 else range(width)
+            ys = range(height - 1, -1, -1) if dy > 0 else range(height)
+            for i in xs:
+                nx = left + i + dx
+                for j in ys:
+                    ny = bottom + j + dy
+                    if not walkable(nx, ny):
+                        continue  # Wall right next to it, stays 0
+
+                    ahead = (i + dx)*height + j + dy
+                    if _forced(walkable, nx, ny, dx, dy) or (dx and dy and (
+                            straight[0][ahead] > 0 or straight[1][ahead] > 0)):
+                        table[i*height + j] = 1
+                    else:
+                        distance = table[ahead]
+                        table[i*height + j] = distance + 1 if distance > 0 else distance - 1
+
+    def successors(self, current, direction, end):
+        """
+        Jump points (and points lined up with `end`) reachable from `current`
+        """
+        if self.version != self.Map.version:
+            self.build()
+
+        x, y = current
+        i = x - self.left
+        j = y - self.bottom
+        if i < 0 or j < 0 or i >= self.width or j >= self.height:
+            return []
+        index = i*self.height + j
+
+        found = []
+        for dx, dy in _directions(self.walkable, x, y, direction):
+            distance = self.distances[(dx, dy)][index]
+            reach = abs(distance)
+
+            # Is the end (or the row/column it is on) along this line?
+            ex = (end[0] - x)*dx
+            ey = (end[1] - y)*dy
+            if dx and dy:
+                steps = min(ex, ey) if ex > 0 and ey > 0 else 0
+            elif dx:
+                steps = ex if ex > 0 and end[1] == y else 0
+            else:
+                steps = ey if ey > 0 and end[0] == x else 0
+
+            if steps and steps <= reach:
+                found.append(((x + dx*steps, y + dy*steps), (dx, dy)))
+                if steps >= distance:
+                    continue
+            if distance > 0:
+                found.append(((x + dx*distance, y + dy*distance), (dx, dy)))
+        return found
+
+
+def _jps(successors, start, end, max_iterations, stats=None):
+    """
+    A* that only puts jump points on the heap.
+    """
+    G = {start: 0}
+    came_from = {}
+    direction = {start: None}
+    closed_vertices = set()
+
+    h = heuristic(start, end)
+    counter = 0
+    open_heap = [(h, h, counter, start)]
+
+    count = 0
+    while open_heap:
+        current = heappop(open_heap)[3]
+        if current in closed_vertices:
+            continue
+
+        count += 1
+        if count > max_iterations:
+            if stats is not None:
+                stats.capped = True
+            break
+        if stats is not None:
+            stats.expand(len(open_heap) + 1)
+
+        if current == end:
+            # Retrace our route backward, filling in the tiles between jump points
+            tiles = array("i", (current[1], current[0]))
+            while current in came_from:
+                previous = came_from[current]
+                dx, dy = direction[current]
+                x, y = current
+                while (x, y) != previous:
+                    x -= dx
+                    y -= dy
+                    tiles.append(y)
+                    tiles.append(x)
+                current = previous
+            tiles.reverse()
+
+            return tiles  # Done!
+
+        closed_vertices.add(current)
+        current_g = G[current]
+
+        for node, step in successors(current, direction[current]):
+            if node in closed_vertices:
+                continue
+
+            steps = max(abs(node[0] - current[0]), abs(node[1] - current[1]))
+            candidate_g = current_g + steps*move_cost((0, 0), step)
+            if node in G and candidate_g >= G[node]:
+                continue
+
+            came_from[node] = current
+            direction[node] = step
+            G[node] = candidate_g
+            h = heuristic(node, end)
+            counter += 1
+            heappush(open_heap, (candidate_g + h, h, counter, node))
+
+    return array("i")
+
+
+def JPSSearch(Map, start: Point, end: Point, allow_diagonal_movement: bool=True, movelist=[], min_dist=0, table: Optional[JumpTable]=None, stats: Optional[SearchStats]=None, output: str="list", first: Optional[int]=None, any_angle: bool=False):
+    """
+    Jump Point Search, finds paths as short as `AStarSearch` while only
+    putting turning points on the heap. Returns the path in the same format.
+
+    Pass a `JumpTable` to skip the jumping for maps that do not change.
+    Falls back to plain A* without diagonal movement or with a `min_dist`.
+    `output`, `first` and `any_angle` work like in `AStarSearch`.
+    """
+    tilesize = Map.tilesize
+
+    start = _to_tile(Map, start)
+    end = _to_tile(Map, end)
+
+    if not allow_diagonal_movement or min_dist > 0:
+        return _search(Map, start, end, allow_diagonal_movement, movelist, min_dist, None, stats, False, output, first, any_angle)
+
+    walkable = Map.walkable(movelist)
+    if table is not None:
+        def successors(current, direction):
+            return table.successors(current, direction, end)
+    else:
+        def successors(current, direction):
+            found = []
+            x, y = current
+            for dx, dy in _directions(walkable, x, y, direction):
+                node = _jump(walkable, x + dx, y + dy, dx, dy, end)
+                if node is not None:
+                    found.append((node, (dx, dy)))
+            return found
+
+    if stats is not None:
+        stats.begin()
+    left, bottom, right, top = Map.bounds()
+    tiles = _jps(successors, start, end, (right - left)*(top - bottom), stats)
+    if stats is not None:
+        stats.end(len(tiles)//2)
+    if any_angle:
+        tiles = _string_pull(walkable, tiles)
+    return _format(tiles, tilesize, output, first)
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import threading
+from array import array
+from typing import Optional
+from pathfindingfuncs import heuristic
+from pathfinding import _dijkstra, _adjacent
+
+
+__all__ = (
+    "LandmarkTable",
+)
+
+
+class LandmarkTable:
+    """
+    Landmark (ALT) estimates for A*, for maps where `heuristic` is far too
+    low, like mazes, and A* ends up flooding dead ends.
+
+    A few landmark tiles are picked far apart and the cost from each of them
+    to every tile is worked out once. Going from a tile to the end can not
+    cost less than the difference of their costs from any landmark, so
+    A* gets a much tighter estimate and paths stay as short as before.
+    Pass it to `AStarSearch`, `AStarWDict` or `AStarWLayeredDict` with `landmarks=`.
+
+    Costs are kept as one array per landmark, in tenths of `move_cost`
+    (`-1` for tiles the landmark can not reach), by flat index
+    `(x - left)*height + (y - bottom)`.
+    When the map's `version` changes the tables are rebuilt, in a background
+    thread unless `background` is False, and searches use the plain
+    `heuristic` until the new ones are ready.
+    Built for unweighted moves, the estimate is still a lower bound for
+    searches whose tile costs are all 1 or more. Searches with cheaper
+    tiles leave the landmarks out and use `heuristic`.
+    """
+
+    __slots__ = (
+        "Map",
+        "movelist",
+        "allow_diagonal_movement",
+        "count",
+        "background",
+        "landmarks",
+        "tables",
+        "builder"
+    )
+
+    def __init__(self, Map, movelist=[], allow_diagonal_movement: bool=True, count: int=8, background: bool=True):
+        """
+        :param Map: Map to build over, it needs `walkable`, `bounds` and `version`
+        :param movelist: Tiles that can be walked on
+        :param bool allow_diagonal_movement: Whether diagonal steps are allowed,
+            a table built with them also works for searches without
+        :param int count: How many landmarks to pick, every one costs a search and an array
+        :param bool background: Rebuild in a thread when the map changes
+        """
+        self.Map = Map
+        self.movelist = movelist
+        self.allow_diagonal_movement = allow_diagonal_movement
+        self.count = count
+        self.background = background
+        self.landmarks = []
+        self.tables = (None, (), None)  # (version, arrays, bounds), swapped in all at once
+        self.builder = None
+        self.build()
+
+    def build(self) -> None:
+        """
+        Picks the landmarks and works out their costs, right away
+        """
+        Map = self.Map
+        version = Map.version
+        walkable = Map.walkable(self.movelist)
+        adjacent_squares = _adjacent(self.allow_diagonal_movement)
+        bounds = Map.bounds()
+        left, bottom, right, top = bounds
+        height = top - bottom
+        size = (right - left)*height
+
+        def costs(landmark):
+            row = array("i", [-1])*size
+            for (x, y), g in _dijkstra(walkable, [landmark], adjacent_squares)[0].items():
+                row[(x - left)*height + y - bottom] = round(g*10)
+            return row
+
+        seed = None
+        for x in range(left, right):
+            for y in range(bottom, top):
+                if walkable(x, y):
+                    seed = (x, y)
+                    break
+            if seed is not None:
+                break
+
+        landmarks = []
+        rows = []
+        if seed is not None:
+            # Farthest first: the first landmark is the tile farthest from
+            # the seed, every next one the tile farthest from all picked so far
+            nearest = costs(seed)
+            for _ in range(self.count):
+                index = max(range(size), key=nearest.__getitem__)
+                if nearest[index] <= 0:
+                    break  # Every reachable tile is a landmark already
+                landmark = (left + index//height, bottom + index % height)
+                row = costs(landmark)
+                if not landmarks:
+                    nearest = array("i", row)
+                else:
+                    nearest = array("i", map(min, nearest, row))
+                landmarks.append(landmark)
+                rows.append(row)
+
+        self.landmarks = landmarks
+        self.tables = (version, tuple(rows), bounds)
+
+    def _rebuild(self) -> None:
+        builder = self.builder
+        if builder is not None and builder.is_alive():
+            return
+        if not self.background:
+            self.build()
+            return
+        self.builder = threading.Thread(target=self.build, daemon=True)
+        self.builder.start()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits for a background rebuild to finish
+        """
+        builder = self.builder
+        if builder is not None:
+            builder.join(timeout)
+
+    def estimate(self):
+        """
+        Returns a `heuristic(tile, target)` replacement that uses the landmarks,
+        or None while the tables are out of date
+        """
+        version, rows, bounds = self.tables
+        if version != self.Map.version:
+            self._rebuild()
+            version, rows, bounds = self.tables
+            if version != self.Map.version:
+                return None
+
+        left, bottom, right, top = bounds
+        width = right - left
+        height = top - bottom
+        targets = {}
+
+        def estimate(tile, target):
+            goal = targets.get(target)
+            if goal is None:
+                goal = []
+                x = target[0] - left
+                y = target[1] - bottom
+                if 0 <= x < width and 0 <= y < height:
+                    index = x*height + y
+                    goal = [(row, row[index]) for row in rows if row[index] >= 0]
+                targets[target] = goal
+
+            # Never below `heuristic`, switching between the two from tile
+            # to tile would make the estimate inconsistent
+            best = heuristic(tile, target)
+            x = tile[0] - left
+            y = tile[1] - bottom
+            if goal and 0 <= x < width and 0 <= y < height:
+                index = x*height + y
+                best *= 10
+                for row, cost in goal:
+                    difference = row[index]
+                    if difference < 0:
+                        continue
+                    difference -= cost
+                    if difference < 0:
+                        difference = -difference
+                    if difference > best:
+                        best = difference
+                return best/10
+            return best
+        return estimate
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Dict, Tuple
+
+
+__all__ = (
+    "write_map",
+    "read_map",
+)
+
+
+# magic, format, length of the JSON meta, number of sections
+HEADER = struct.Struct("<4sIII")
+# name, typecode, offset, size in bytes
+SECTION = struct.Struct("<16s4sQQ")
+MAGIC = b"EPMF"
+FORMAT = 1
+
+
+def _pad(size: int) -> int:
+    return -size % 8
+
+
+def write_map(filename: str, meta: Dict, sections: Dict[str, array]) -> None:
+    """
+    Writes a map file: a header, `meta` as JSON, a table of the sections,
+    then every section's buffer, each on an 8 byte boundary so it can be
+    used straight from the mapped file.
+
+    :param dict meta: Anything JSON can hold, like sizes and tile values
+    :param sections: Name (up to 16 bytes) -> array, written in native byte order
+    """
+    meta = dict(meta, byteorder=sys.byteorder)
+    text = json.dumps(meta).encode()
+
+    offset = HEADER.size + len(text) + _pad(len(text)) + SECTION.size*len(sections)
+    table = []
+    for name, buffer in sections.items():
+        view = memoryview(buffer)
+        table.append(SECTION.pack(name.encode(), view.format.encode(), offset, view.nbytes))
+        offset += view.nbytes + _pad(view.nbytes)
+
+    with open(filename, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT, len(text), len(sections)))
+        file.write(text + bytes(_pad(len(text))))
+        file.write(b"".join(table))
+        for buffer in sections.values():
+            view = memoryview(buffer)
+            file.write(view)
+            file.write(bytes(_pad(view.nbytes)))
+
+
+def read_map(filename: str) -> Tuple[Dict, Dict[str, memoryview]]:
+    """
+    Maps a file made by `write_map` into memory and returns (meta, sections).
+
+    Sections are memoryviews of the mapped file, cast to their typecode,
+    nothing is read until it is used. They can be written to, the changes
+    stay in this process and never reach the file.
+    """
+    with open(filename, "rb") as file:
+        memory = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    magic, version, length, count = HEADER.unpack_from(memory, 0)
+    if magic != MAGIC:
+        raise ValueError("%s is not a map file" % filename)
+    if version != FORMAT:
+        raise ValueError("%s is map file format %d, expected %d" % (filename, version, FORMAT))
+    start = HEADER.size
+    meta = json.loads(memory[start:start + length])
+    if meta.pop("byteorder") != sys.byteorder:
+        raise ValueError("%s was saved with the other byte order" % filename)
+
+    view = memoryview(memory)
+    sections = {}
+    start += length + _pad(length)
+    for i in range(count):
+        name, typecode, offset, size = SECTION.unpack_from(memory, start + i*SECTION.size)
+        sections[name.rstrip(b"\0").decode()] = view[offset:offset + size].cast(typecode.rstrip(b"\0").decode())
+    return meta, sections
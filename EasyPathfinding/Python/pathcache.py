@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+
+__all__ = (
+    "PathCache",
+)
+
+
+class PathCache:
+    """
+    LRU cache of paths found on one map.
+
+    A cached path is only dropped when a tile on it, or next to it, changed
+    since it was stored. Edits elsewhere keep it, even if they open a shorter
+    route. Cached "no path" results are dropped on any edit.
+    Pass it to the A* functions with `cache=`.
+    """
+
+    __slots__ = (
+        "Map",
+        "maxsize",
+        "entries",
+        "hits",
+        "misses"
+    )
+
+    def __init__(self, Map, maxsize: int=1024):
+        """
+        :param Map: Map the paths are found on, it needs `version` and `changed_since`
+        :param int maxsize: How many paths to keep before the oldest is dropped
+        """
+        self.Map = Map
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # key -> [version, flat array of the tiles on the path]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[array]:
+        """
+        Returns a copy of the cached tiles (x0, y0, x1, y1, ...), None if there is none or it went stale
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        version = self.Map.version
+        if entry[0] != version:
+            changed = self.Map.changed_since(entry[0])
+            if changed is None or not entry[1] or self._touches(entry[1], changed):
+                del self.entries[key]
+                self.misses += 1
+                return None
+            entry[0] = version
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1][:]
+
+    def put(self, key, tiles: array) -> None:
+        """
+        Stores a path as a flat array of the tiles it passes through
+        """
+        self.entries[key] = [self.Map.version, tiles[:]]
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    @staticmethod
+    def _touches(tiles, changed) -> bool:
+        near = set()
+        for x, y in changed:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    near.add((x + dx, y + dy))
+        for i in range(0, len(tiles), 2):
+            if (tiles[i], tiles[i + 1]) in near:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -1,421 +1,751 @@
 from pathfindingfuncs import *
 from customMaps import *
-from pathfindingfuncs import Point
+from pathfindingfuncs import Point, STRAIGHT_SQUARES, DIAGONAL_SQUARES
+from heapq import heappush, heappop
+from array import array
+from collections import deque
+from typing import Union, Optional, List
+from pathcache import PathCache
+from searchstats import SearchStats
+from region import Region
+from smoothing import _string_pull
 
 
 __all__ = (
     "AStarSearch",
     "SearchTilesAround",
     "AStarWDict",
-    "SearchTilesAroundWDict",
+    "SearchAroundWDict",
     "AStarWLayeredDict",
-    "SearchTilesAroundWLayeredDict",
+    "SearchAroundWLayeredDict",
+    "AStarMany",
+    "AStarManyWDict",
+    "AStarManyWLayeredDict",
 )
 
 
-def AStarSearch(Map: LivingMap, start: Point, end: Point, allow_diagonal_movement:bool=True, movelist=[], min_dist=0):
-    tilesize = Map.tilesize
-    length = Map.length
-    height = Map.height
-
-    start = (round(start[0]/tilesize), round(start[1]/tilesize))
-    end = (round(end[0]/tilesize), round(end[1]/tilesize))
-
-    G = {}  # Actual movement cost to each position from the start position
-    F = {}  # Estimated movement cost of start to end going via this position
-
-    graph = Map.graph
-    max_iterations = len(graph[0]) * len(graph)
-
-    # Initialize starting values
-    G[start] = 0
-    F[start] = heuristic(start, end)
-
-    closed_vertices = set()
-    open_vertices = set([start])
-    came_from = {}
-
+def _adjacent(allow_diagonal_movement: bool):
     # what squares do we search
-    adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0),)
     if allow_diagonal_movement:
-        adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1),)
-
-    count = 0
-    while len(open_vertices) > 0:
-        count += 1
-        if count > max_iterations:
-            break
-
-        # Get the vertex in the open list with the lowest F score
-        current = None
-        current_fscore = None
-        for pos in open_vertices:
-            if current is None or F[pos] < current_fscore:
-                current_fscore = F[pos]
-                current = pos
-
-        # Check if we have reached the goal
-        dist = get_dist(current, end)*tilesize
-        if dist <= min_dist:
-            # Retrace our route backward
-            path = [[current[0]*tilesize, current[1]*tilesize]]
-            while current in came_from:
-                current = came_from[current]
-                path.append([current[0]*tilesize, current[1]*tilesize])
-            path.reverse()
-
-            return path  # Done!
-
-        # Mark the current vertex as closed
-        open_vertices.remove(current)
-        closed_vertices.add(current)
+        return DIAGONAL_SQUARES
+    return STRAIGHT_SQUARES
 
-        neighbours = []
-        for new_position in adjacent_squares: # Adjacent squares
-            neighbours.append((current[0] + new_position[0], current[1] + new_position[1]))
 
-        # Update scores for vertices near the current position
-        for neighbour in neighbours:
-            if neighbour in closed_vertices:
-                continue  # We have already processed this node exhaustively
-            elif neighbour[0] < 0 or neighbour[1] < 0 or neighbour[0] >= length or neighbour[1] >= height:
-                continue
-            if not graph[neighbour[0]][neighbour[1]] in movelist:
-                continue
-
-            candidate_g = G[current] + move_cost(current, neighbour)
-
-            if not neighbour in open_vertices:
-                open_vertices.add(neighbour)  # Discovered a new vertex
-            elif candidate_g >= G[neighbour]:
-                continue  # This G score is worse than previously found
-
-            # Adopt this G score
-            came_from[neighbour] = current
-            G[neighbour] = candidate_g
-            h = heuristic(neighbour, end)
-            F[neighbour] = G[neighbour] + h
+def _rounding(Map):
+    """
+    How the search functions for this kind of map turn pixels into tiles,
+    `int` for the dict maps, `round` for the others
+    """
+    return int if isinstance(Map, (BarrierDict, ChunkMap)) else round
 
-    # Out-of-bounds
-    return []
 
-
-def SearchTilesAround(Map: LivingMap, start: Point, allow_diagonal_movement: bool=True, movelist=[]):
+def _to_tile(Map, position: Point) -> Point:
+    """
+    Tile under a position in pixels, rounded like the search functions for this kind of map do
+    """
     tilesize = Map.tilesize
-    length = Map.length
-    height = Map.height
-
-    start = (int(start[0]/tilesize), int(start[1]/tilesize))
-
-    graph = Map.graph
-
-    closed_vertices = set()
-    open_vertices = set([start])
-
-    # what squares do we search
-    adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0),)
-    if allow_diagonal_movement:
-        adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1),)
-
-    count = 0
-    while len(open_vertices) > 0:
-        count += 1
-        if count > 500:
-            break
-
-        #get first element in the set
-        for current in open_vertices:
+    convert = _rounding(Map)
+    return (convert(position[0]/tilesize), convert(position[1]/tilesize))
+
+
+def _trace(came_from, current) -> array:
+    """
+    Flat array (x0, y0, x1, y1, ...) of the tiles from the start to `current`
+    """
+    # Built backwards with y before x, one reverse puts it all in order
+    tiles = array("i", (current[1], current[0]))
+    while current in came_from:
+        current = came_from[current]
+        tiles.append(current[1])
+        tiles.append(current[0])
+    tiles.reverse()
+    return tiles
+
+
+def _format(tiles: array, tilesize, output: str="list", first: Optional[int]=None):
+    """
+    Turns a flat array of tiles into the path format asked for
+
+    :param output: "list" for `[[x, y], ...]` in pixels, "array" for a flat
+        array of pixels, "tiles" for the flat array of tiles, "iter" for
+        a generator of (x, y) pixels
+    :param first: Only keep this many points from the start
+    """
+    if first is not None:
+        tiles = tiles[:2*first]
+    if output == "list":
+        return [[tiles[i]*tilesize, tiles[i + 1]*tilesize] for i in range(0, len(tiles), 2)]
+    if output == "tiles":
+        return tiles
+    if output == "array":
+        return array("i" if isinstance(tilesize, int) else "d", [tile*tilesize for tile in tiles])
+    if output == "iter":
+        return ((tiles[i]*tilesize, tiles[i + 1]*tilesize) for i in range(0, len(tiles), 2))
+    raise ValueError("Unknown path output %r" % (output,))
+
+
+class _AStar:
+    """
+    State of one A* search over tiles, using a binary heap as the open list.
+
+    `run` expands tiles until the search is done, or until it has expanded
+    `max_expansions` of them so it can be picked up again later (`AStarTask`).
+    Stale heap entries are skipped when popped (lazy deletion), ties on F are
+    broken by the smaller heuristic, then by insertion order.
+    `walkable` may return a tile's cost (see `TrackedMap.weighted`), a step
+    costs `move_cost` times the cost of the tile stepped onto.
+    `estimate` replaces `heuristic`, like `LandmarkTable.estimate`.
+    """
+
+    __slots__ = (
+        "walkable",
+        "end",
+        "adjacent_squares",
+        "max_iterations",
+        "tilesize",
+        "min_dist",
+        "stats",
+        "estimate",
+        "G",
+        "came_from",
+        "closed_vertices",
+        "open_heap",
+        "counter",
+        "count"
+    )
+
+    def __init__(self, walkable, start, end, adjacent_squares, max_iterations, tilesize, min_dist, stats=None, estimate=heuristic):
+        self.walkable = walkable
+        self.end = end
+        self.adjacent_squares = adjacent_squares
+        self.max_iterations = max_iterations
+        self.tilesize = tilesize
+        self.min_dist = min_dist
+        self.stats = stats
+        self.estimate = estimate
+
+        self.G = {start: 0}  # Actual movement cost to each position from the start position
+        self.came_from = {}
+        self.closed_vertices = set()
+        h = estimate(start, end)
+        self.open_heap = [(h, h, 0, start)]
+        self.counter = 0
+        self.count = 0
+
+    def run(self, max_expansions: Optional[int] = None) -> Optional[array]:
+        """
+        Returns the tiles of the path (empty if there is none), or None if
+        `max_expansions` tiles were expanded before the search was done
+        """
+        walkable = self.walkable
+        end = self.end
+        adjacent_squares = self.adjacent_squares
+        max_iterations = self.max_iterations
+        tilesize = self.tilesize
+        min_dist = self.min_dist
+        stats = self.stats
+        estimate = self.estimate
+        G = self.G
+        came_from = self.came_from
+        closed_vertices = self.closed_vertices
+        open_heap = self.open_heap
+        counter = self.counter
+        count = self.count
+        budget = count + max_expansions if max_expansions is not None else max_iterations + 1
+
+        tiles = array("i")  # Out-of-bounds unless the end is found
+        while open_heap:
+            if count >= budget:
+                tiles = None
+                break
+            current = heappop(open_heap)[3]
+            if current in closed_vertices:
+                continue  # Stale entry, a better one was already processed
+
+            count += 1
+            if count > max_iterations:
+                if stats is not None:
+                    stats.capped = True
+                break
+            if stats is not None:
+                stats.expand(len(open_heap) + 1)
+
+            # Check if we have reached the goal
+            if get_dist(current, end)*tilesize <= min_dist:
+                tiles = _trace(came_from, current)  # Done!
+                break
+
+            # Mark the current vertex as closed
+            closed_vertices.add(current)
+            current_g = G[current]
+
+            # Update scores for vertices near the current position
+            for dx, dy in adjacent_squares:
+                neighbour = (current[0] + dx, current[1] + dy)
+                if neighbour in closed_vertices:
+                    continue  # We have already processed this node exhaustively
+                # 1 (or True) for a plain walkable tile, its cost on a weighted map
+                step = walkable(neighbour[0], neighbour[1])
+                if not step:
+                    continue
+
+                candidate_g = current_g + move_cost(current, neighbour)*step
+                if neighbour in G and candidate_g >= G[neighbour]:
+                    continue  # This G score is worse than previously found
+
+                # Adopt this G score
+                came_from[neighbour] = current
+                G[neighbour] = candidate_g
+                h = estimate(neighbour, end)
+                counter += 1
+                heappush(open_heap, (candidate_g + h, h, counter, neighbour))
+
+        self.counter = counter
+        self.count = count
+        return tiles
+
+
+def _astar(walkable, start, end, adjacent_squares, max_iterations, tilesize, min_dist, stats=None, estimate=heuristic):
+    """
+    A* over tiles, see `_AStar`
+    """
+    return _AStar(walkable, start, end, adjacent_squares, max_iterations, tilesize, min_dist, stats, estimate).run()
+
+
+def _bidirectional(walkable, start, end, adjacent_squares, max_iterations, tilesize, stats=None, estimate=heuristic):
+    """
+    A* grown from both ends at once until the two searches meet (MM).
+
+    Tiles are taken in order of max(F, 2*G), so each side stays on its own
+    half of the path. It stops once no unexpanded tile can give a path
+    cheaper than the best meeting found, which keeps the path as short as `_astar`'s.
+    """
+    if start == end:
+        return array("i", start)
+    if not walkable(end[0], end[1]):
+        return array("i")  # `_astar` never steps onto a blocked end either
+
+    # index 0 grows from the start, index 1 from the end
+    G = ({start: 0}, {end: 0})
+    came_from = ({}, {})
+    closed_vertices = (set(), set())
+    targets = (end, start)
+
+    h = estimate(start, end)
+    counter = 1
+    open_heaps = ([(h, h, 0, start)], [(h, h, 1, end)])
+
+    best = float("inf")  # Cost of the cheapest path found so far
+    meeting = None
+
+    counts = [0, 0]  # Each side may expand every tile once
+    while open_heaps[0] and open_heaps[1]:
+        # Drop stale entries so the tops are real lower bounds
+        for side in (0, 1):
+            heap = open_heaps[side]
+            while heap and heap[0][3] in closed_vertices[side]:
+                heappop(heap)
+        if not open_heaps[0] or not open_heaps[1]:
             break
-        open_vertices.remove(current)
-        closed_vertices.add(current)
-
-        neighbours = []
-        for new_position in adjacent_squares: # Adjacent squares
-            neighbours.append((current[0] + new_position[0], current[1] + new_position[1]))
-
-        # Update scores for vertices near the current position
-        for neighbour in neighbours:
-            if neighbour[0] < 0 or neighbour[1] < 0 or neighbour[0] >= length or neighbour[1] >= height:
+        if best <= min(open_heaps[0][0][0], open_heaps[1][0][0]):
+            break  # Nothing left can beat the path we have
+
+        side = 0 if open_heaps[0][0][0] <= open_heaps[1][0][0] else 1
+        current = heappop(open_heaps[side])[3]
+
+        counts[side] += 1
+        if counts[side] > max_iterations:
+            if stats is not None:
+                stats.capped = True
+            return array("i")
+        if stats is not None:
+            stats.expand(len(open_heaps[0]) + len(open_heaps[1]) + 1)
+
+        closed = closed_vertices[side]
+        closed.add(current)
+        g = G[side]
+        other = G[1 - side]
+        target = targets[side]
+        current_g = g[current]
+        if side:
+            if current == start:
+                continue  # Only a meeting point, paths do not go on through the start
+            # Going backwards, a step costs what the tile it comes from costs
+            price = walkable(current[0], current[1])
+
+        for dx, dy in adjacent_squares:
+            neighbour = (current[0] + dx, current[1] + dy)
+            if neighbour in closed:
                 continue
-            elif not graph[neighbour[0]][neighbour[1]] in movelist:
+            step = walkable(neighbour[0], neighbour[1])
+            # Going backwards, the start is the one blocked tile that may be stepped on
+            if not step and not (side and neighbour == start):
                 continue
-            elif neighbour in closed_vertices:
-                continue
-            elif not neighbour in open_vertices:
-                open_vertices.add(neighbour)  
-
-    return count
 
+            candidate_g = current_g + move_cost(current, neighbour)*(price if side else step)
+            if neighbour in g and candidate_g >= g[neighbour]:
+                continue
 
-def AStarWDict(Map: BarrierDict, start: Point, end: Point, allow_diagonal_movement: bool=True, movelist=[], min_dist=0):
-    tilesize = Map.tilesize
-    length = Map.length
-    height = Map.height
-
-    start = (int(start[0]/tilesize), int(start[1]/tilesize))
-    end = (int(end[0]/tilesize), int(end[1]/tilesize))
-
-    G = {}  # Actual movement cost to each position from the start position
-    F = {}  # Estimated movement cost of start to end going via this position
-
-    graph = Map.barrier_dict
-    max_iterations = len(Map.length) * len(Map.height)
-
-    # Initialize starting values
-    G[start] = 0
-    F[start] = heuristic(start, end)
-
-    closed_vertices = set()
-    open_vertices = set([start])
+            came_from[side][neighbour] = current
+            g[neighbour] = candidate_g
+            if neighbour in other and candidate_g + other[neighbour] < best:
+                best = candidate_g + other[neighbour]
+                meeting = neighbour
+
+            h = estimate(neighbour, target)
+            counter += 1
+            heappush(open_heaps[side], (max(candidate_g + h, 2*candidate_g), h, counter, neighbour))
+
+    if meeting is None:
+        return array("i")
+
+    # Retrace both halves from where they met
+    tiles = _trace(came_from[0], meeting)
+    current = meeting
+    while current in came_from[1]:
+        current = came_from[1][current]
+        tiles.append(current[0])
+        tiles.append(current[1])
+    return tiles
+
+
+def _dijkstra(walkable, sources, adjacent_squares, targets=None, stats=None, backward=False):
+    """
+    Grows the cheapest-path tree out from the tiles in `sources`.
+
+    Returns (G, came_from), where came_from points every reached tile one step
+    back towards the closest source. Stops early once every tile in `targets`
+    is closed.
+    On a weighted map a step costs what the tile stepped onto costs, with
+    `backward` what the tile stepped from costs, so G is the cost of going to the sources.
+    """
+    G = {}
     came_from = {}
-
-    # what squares do we search
-    adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0),)
-    if allow_diagonal_movement:
-        adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1),)
-
-    count = 0
-    while len(open_vertices) > 0:
-        count += 1
-        if count > max_iterations:
-            break
-
-        # Get the vertex in the open list with the lowest F score
-        current = None
-        current_fscore = None
-        for pos in open_vertices:
-            if current is None or F[pos] < current_fscore:
-                current_fscore = F[pos]
-                current = pos
-
-        # Check if we have reached the goal
-        dist = get_dist(current, end)*50
-        if dist <= min_dist:
-            # Retrace our route backward
-            path = [[current[0]*tilesize, current[1]*tilesize]]
-            while current in came_from:
-                current = came_from[current]
-                path.append([current[0]*tilesize, current[1]*tilesize])
-            path.reverse()
-
-            return path  # Done!
-
-        # Mark the current vertex as closed
-        open_vertices.remove(current)
+    closed_vertices = set()
+    remaining = set(targets) if targets is not None else None
+
+    counter = 0
+    open_heap = []
+    for source in sources:
+        G[source] = 0
+        counter += 1
+        open_heap.append((0, counter, source))
+    while open_heap:
+        current_g, _, current = heappop(open_heap)
+        if current in closed_vertices:
+            continue
         closed_vertices.add(current)
-
-        neighbours = []
-        for new_position in adjacent_squares: # Adjacent squares
-            neighbours.append((current[0] + new_position[0], current[1] + new_position[1]))
-
-        # Update scores for vertices near the current position
-        for neighbour in neighbours:
+        if stats is not None:
+            stats.expand(len(open_heap) + 1)
+
+        if remaining is not None:
+            remaining.discard(current)
+            if not remaining:
+                break
+        if backward:
+            # A blocked source still lets paths end on it
+            price = walkable(current[0], current[1]) or 1
+
+        for dx, dy in adjacent_squares:
+            neighbour = (current[0] + dx, current[1] + dy)
             if neighbour in closed_vertices:
-                continue  # We have already processed this node exhaustively
-            elif neighbour[0] < 0 or neighbour[1] < 0 or neighbour[0] >= length or neighbour[1] >= height:
+                continue
+            step = walkable(neighbour[0], neighbour[1])
+            if not step:
                 continue
 
-            if not graph[neighbour[0]][neighbour[1]] in movelist:
+            candidate_g = current_g + move_cost(current, neighbour)*(price if backward else step)
+            if neighbour in G and candidate_g >= G[neighbour]:
                 continue
 
+            came_from[neighbour] = current
+            G[neighbour] = candidate_g
+            counter += 1
+            heappush(open_heap, (candidate_g, counter, neighbour))
 
-            candidate_g = G[current] + move_cost(current, neighbour)
+    return G, came_from
 
-            if not neighbour in open_vertices:
-                open_vertices.add(neighbour)  # Discovered a new vertex
-            elif candidate_g >= G[neighbour]:
-                continue  # This G score is worse than previously found
 
-            # Adopt this G score
-            came_from[neighbour] = current
-            G[neighbour] = candidate_g
-            h = heuristic(neighbour, end)
-            F[neighbour] = G[neighbour] + h
+def _walkable(Map, movelist, costs=None):
+    """
+    `Map.walkable`, or `Map.weighted` when there are tile costs
+    """
+    if costs:
+        return Map.weighted(movelist, costs)
+    return Map.walkable(movelist)
 
-    # Out-of-bounds
-    return []
 
+def _estimate(landmarks, min_dist, costs):
+    """
+    `landmarks.estimate()` when the landmarks can be used, `heuristic` otherwise
+    """
+    # Landmark bounds are to `end` itself, too much for the tiles around it `min_dist` allows,
+    # and built for steps that cost at least 1, too much with cheaper tiles
+    if landmarks is None or min_dist > 0 or costs and min(costs.values()) < 1:
+        return heuristic
+    return landmarks.estimate() or heuristic
 
-def SearchAroundWDict(Map: BarrierDict, start: Point, allow_diagonal_movement: bool=True, movelist=[]):
-    tilesize = Map.tilesize
-    length = Map.length
-    height = Map.height
 
-    start = (int(start[0]/tilesize), int(start[1]/tilesize))
+def _search(Map, start, end, allow_diagonal_movement, movelist, min_dist, cache, stats=None, bidirectional=False, output="list", first=None, any_angle=False, costs=None, landmarks=None):
+    """
+    Runs `_astar` (or `_bidirectional`) between two tiles, going through `cache` if there is one.
+    The cache keeps the tile path, `any_angle` smoothing is done after.
+    """
+    if stats is not None:
+        stats.begin()
 
-    graph = Map.barrier_dict
+    tilesize = Map.tilesize
+    left, bottom, right, top = Map.bounds()
+    max_iterations = (right - left)*(top - bottom)  # Every tile on the map
+
+    if cache is not None:
+        key = (start, end, frozenset(movelist), allow_diagonal_movement, min_dist)
+        if costs:
+            key += (frozenset(costs.items()),)
+        tiles = cache.get(key)
+        if tiles is not None:
+            if stats is not None:
+                stats.cached = True
+                stats.end(len(tiles)//2)
+            if any_angle:
+                tiles = _string_pull(Map.walkable(movelist), tiles)
+            return _format(tiles, tilesize, output, first)
+
+    index = Map.components.get((frozenset(movelist), allow_diagonal_movement)) if Map.components else None
+    if index is not None and min_dist <= 0 and not index.connected(start, end):
+        if stats is not None:
+            stats.end(0)
+        return _format(array("i"), tilesize, output)  # Different regions, no need to search
+
+    estimate = _estimate(landmarks, min_dist, costs)
+
+    if bidirectional and min_dist <= 0:
+        tiles = _bidirectional(
+            _walkable(Map, movelist, costs), start, end, _adjacent(allow_diagonal_movement),
+            max_iterations, tilesize, stats, estimate
+        )
+    else:
+        tiles = _astar(
+            _walkable(Map, movelist, costs), start, end, _adjacent(allow_diagonal_movement),
+            max_iterations, tilesize, min_dist, stats, estimate
+        )
+
+    if cache is not None:
+        cache.put(key, tiles)
+    if stats is not None:
+        stats.end(len(tiles)//2)
+    if any_angle:
+        tiles = _string_pull(Map.walkable(movelist), tiles)
+    return _format(tiles, tilesize, output, first)
+
+
+def _search_region(Map, start, allow_diagonal_movement, movelist, max_tiles, max_steps, distances, stats, costs=None):
+    """
+    Breadth-first walk outwards from `start`, stops when it runs out of
+    tiles, has `max_tiles` of them, or every tile left is more than
+    `max_steps` steps away.
+    With `costs` it goes cheapest first, and a step counts as the cost of the tile stepped onto.
+    """
+    if stats is not None:
+        stats.begin()
 
-    closed_vertices = set()
-    open_vertices = set([start])
+    tilesize = Map.tilesize
 
-    # what squares do we search
-    adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0),)
-    if allow_diagonal_movement:
-        adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1),)
+    start = (int(start[0]/tilesize), int(start[1]/tilesize))
 
-    count = 0
-    while len(open_vertices) > 0:
-        count += 1
-        if count > 100:
+    walkable = _walkable(Map, movelist, costs)
+    bounds = Map.bounds()
+    left, bottom, right, top = bounds
+    height = top - bottom
+
+    adjacent_squares = _adjacent(allow_diagonal_movement)
+
+    indices = array("l")
+    if not (left <= start[0] < right and bottom <= start[1] < top) or max_tiles is not None and max_tiles < 1:
+        if stats is not None:
+            stats.end(0)
+        return Region(bounds, indices, array("l") if distances else None)
+
+    if costs:
+        return _cheapest_region(walkable, start, bounds, adjacent_squares, max_tiles, max_steps, distances, stats)
+
+    # Tiles by flat index, with how many steps away they are
+    seen = {(start[0] - left)*height + start[1] - bottom: 0}
+    queue = deque([(start[0], start[1], 0)])
+    capped = False
+    while queue:
+        x, y, steps = queue.popleft()
+        if stats is not None:
+            stats.expand(len(queue) + 1)
+        if max_steps is not None and steps >= max_steps:
+            continue
+
+        steps += 1
+        for dx, dy in adjacent_squares:
+            nx = x + dx
+            ny = y + dy
+            index = (nx - left)*height + ny - bottom
+            if index in seen or not walkable(nx, ny):
+                continue
+            if max_tiles is not None and len(seen) >= max_tiles:
+                capped = True
+                break
+            seen[index] = steps
+            queue.append((nx, ny, steps))
+        if capped:
             break
 
-        #get first element in the set
-        for current in open_vertices:
+    indices.extend(seen)
+    if stats is not None:
+        stats.capped = capped
+        stats.end(len(indices))
+    return Region(bounds, indices, array("l", seen.values()) if distances else None, capped)
+
+
+def _cheapest_region(walkable, start, bounds, adjacent_squares, max_tiles, max_steps, distances, stats):
+    """
+    `_search_region` on a weighted map, tiles are taken cheapest first
+    """
+    left, bottom, right, top = bounds
+    height = top - bottom
+
+    # Cost of every tile reached so far, by flat index
+    G = {(start[0] - left)*height + start[1] - bottom: 0}
+    reached = {}
+    counter = 0
+    open_heap = [(0, counter, start[0], start[1])]
+    capped = False
+    while open_heap:
+        g, _, x, y = heappop(open_heap)
+        index = (x - left)*height + y - bottom
+        if index in reached:
+            continue
+        if max_tiles is not None and len(reached) >= max_tiles:
+            capped = True
             break
-        open_vertices.remove(current)
-        closed_vertices.add(current)
-
-        neighbours = []
-        for new_position in adjacent_squares: # Adjacent squares
-            neighbours.append((current[0] + new_position[0], current[1] + new_position[1]))
-
-        # Update scores for vertices near the current position
-        for neighbour in neighbours:
-            if neighbour[0] < 0 or neighbour[1] < 0 or neighbour[0] >= length or neighbour[1] >= height:
+        reached[index] = g
+        if stats is not None:
+            stats.expand(len(open_heap) + 1)
+
+        for dx, dy in adjacent_squares:
+            nx = x + dx
+            ny = y + dy
+            index = (nx - left)*height + ny - bottom
+            if index in reached:
                 continue
-            elif not graph[neighbour[0]][neighbour[1]] in movelist:
+            step = walkable(nx, ny)
+            if not step:
                 continue
-            elif neighbour in closed_vertices:
+            candidate_g = g + step
+            if max_steps is not None and candidate_g > max_steps:
                 continue
-            elif not neighbour in open_vertices:
-                open_vertices.add(neighbour)
-
-    # Out-of-bounds
-    return count
-
-
-
-def AStarWLayeredDict(Map: LayeredBarrierDict, start: Point, end: Point, allow_diagonal_movement: bool=True, movelist=[], min_dist=0):
+            if index in G and candidate_g >= G[index]:
+                continue
+            G[index] = candidate_g
+            counter += 1
+            heappush(open_heap, (candidate_g, counter, nx, ny))
+
+    indices = array("l", reached)
+    if stats is not None:
+        stats.capped = capped
+        stats.end(len(indices))
+    return Region(bounds, indices, array("d", reached.values()) if distances else None, capped)
+
+
+def AStarSearch(Map: Union[LivingMap, ArrayMap], start: Point, end: Point, allow_diagonal_movement:bool=True, movelist=[], min_dist=0, cache: Optional[PathCache]=None, stats: Optional[SearchStats]=None, bidirectional: bool=False, output: str="list", first: Optional[int]=None, any_angle: bool=False, costs: Optional[dict]=None, landmarks=None):
+    """
+    Path from `start` to `end`, `[]` if there is none.
+
+    :param output: "list" (default) for `[[x, y], ...]` in pixels, "array" for a
+        flat `array` of pixels (x0, y0, x1, y1, ...), "tiles" for the same in
+        tiles, or "iter" for a generator of (x, y) pixels.
+        `numpy.frombuffer(path, numpy.int32).reshape(-1, 2)` turns the arrays into a numpy array without a copy
+    :param first: Only return this many points from the start
+    :param bool any_angle: Only keep the points where the path turns, see `SmoothPath`
+        (it only looks at which tiles can be walked on, not at their cost)
+    :param dict costs: Cost of stepping onto each kind of tile in `movelist`, as a
+        multiple of a normal step, kinds left out cost 1. Costs must be at least
+        `Map.min_cost`. The map keeps a grid of them, see `cost_grid`.
+    :param landmarks: A `LandmarkTable` for this map and movelist, gives A* a
+        tighter estimate so it expands fewer tiles (not used with a `min_dist`)
+    """
     tilesize = Map.tilesize
-    length = Map.length
-    height = Map.height
 
-    start = (int(start[0]/tilesize), int(start[1]/tilesize))
-    end = (int(end[0]/tilesize), int(end[1]/tilesize))
+    start = (round(start[0]/tilesize), round(start[1]/tilesize))
+    end = (round(end[0]/tilesize), round(end[1]/tilesize))
 
-    G = {}  # Actual movement cost to each position from the start position
-    F = {}  # Estimated movement cost of start to end going via this position
+    return _search(Map, start, end, allow_diagonal_movement, movelist, min_dist, cache, stats, bidirectional, output, first, any_angle, costs, landmarks)
 
-    graph = Map.barrier_dict
-    max_iterations = len(Map.length) * len(Map.height)
 
-    # Initialize starting values
-    G[start] = 0
-    F[start] = heuristic(start, end)
+def SearchTilesAround(Map: Union[LivingMap, ArrayMap], start: Point, allow_diagonal_movement: bool=True, movelist=[], max_tiles: Optional[int]=500, max_steps: Optional[int]=None, distances: bool=False, stats: Optional[SearchStats]=None, costs: Optional[dict]=None) -> Region:
+    """
+    Tiles that can be reached from `start`, closest first.
 
-    closed_vertices = set()
-    open_vertices = set([start])
-    came_from = {}
+    :param max_tiles: Stop once this many tiles were found, None for no limit
+    :param max_steps: Only go this many steps away from `start`, None for no limit
+    :param bool distances: Also keep how many steps away every tile is
+    :param dict costs: Cost of stepping onto each kind of tile (default 1), see `AStarSearch`.
+        Tiles then come cheapest first and `max_steps` and distances count cost instead of steps
+    """
+    return _search_region(Map, start, allow_diagonal_movement, movelist, max_tiles, max_steps, distances, stats, costs)
 
-    # what squares do we search
-    adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0),)
-    if allow_diagonal_movement:
-        adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1),)
 
-    count = 0
-    while len(open_vertices) > 0:
-        count += 1
-        if count > max_iterations:
-            break
+def AStarWDict(Map: BarrierDict, start: Point, end: Point, allow_diagonal_movement: bool=True, movelist=[], min_dist=0, cache: Optional[PathCache]=None, stats: Optional[SearchStats]=None, bidirectional: bool=False, output: str="list", first: Optional[int]=None, any_angle: bool=False, costs: Optional[dict]=None, landmarks=None):
+    tilesize = Map.tilesize
 
-        # Get the vertex in the open list with the lowest F score
-        current = None
-        current_fscore = None
-        for pos in open_vertices:
-            if current is None or F[pos] < current_fscore:
-                current_fscore = F[pos]
-                current = pos
-
-        # Check if we have reached the goal
-        dist = get_dist(current, end)*50
-        if dist <= min_dist:
-            # Retrace our route backward
-            path = [[current[0]*tilesize, current[1]*tilesize]]
-            while current in came_from:
-                current = came_from[current]
-                path.append([current[0]*tilesize, current[1]*tilesize])
-            path.reverse()
-
-            return path  # Done!
-
-        # Mark the current vertex as closed
-        open_vertices.remove(current)
-        closed_vertices.add(current)
+    start = (int(start[0]/tilesize), int(start[1]/tilesize))
+    end = (int(end[0]/tilesize), int(end[1]/tilesize))
 
-        neighbours = []
-        for new_position in adjacent_squares: # Adjacent squares
-            neighbours.append((current[0] + new_position[0], current[1] + new_position[1]))
+    return _search(Map, start, end, allow_diagonal_movement, movelist, min_dist, cache, stats, bidirectional, output, first, any_angle, costs, landmarks)
 
-        # Update scores for vertices near the current position
-        for neighbour in neighbours:
-            if neighbour in closed_vertices:
-                continue  # We have already processed this node exhaustively
-            elif neighbour[0] < 0 or neighbour[1] < 0 or neighbour[0] >= length or neighbour[1] >= height:
-                continue
-            if not graph[neighbour[0]][neighbour[1]].layer in movelist:
-                continue
 
-            candidate_g = G[current] + move_cost(current, neighbour)
+def SearchAroundWDict(Map: BarrierDict, start: Point, allow_diagonal_movement: bool=True, movelist=[], max_tiles: Optional[int]=100, max_steps: Optional[int]=None, distances: bool=False, stats: Optional[SearchStats]=None, costs: Optional[dict]=None) -> Region:
+    """
+    Tiles that can be reached from `start`, closest first.
 
-            if not neighbour in open_vertices:
-                open_vertices.add(neighbour)  # Discovered a new vertex
-            elif candidate_g >= G[neighbour]:
-                continue  # This G score is worse than previously found
+    :param max_tiles: Stop once this many tiles were found, None for no limit
+    :param max_steps: Only go this many steps away from `start`, None for no limit
+    :param bool distances: Also keep how many steps away every tile is
+    :param dict costs: Cost of stepping onto each kind of tile (default 1), see `AStarSearch`.
+        Tiles then come cheapest first and `max_steps` and distances count cost instead of steps
+    """
+    return _search_region(Map, start, allow_diagonal_movement, movelist, max_tiles, max_steps, distances, stats, costs)
 
-            # Adopt this G score
-            came_from[neighbour] = current
-            G[neighbour] = candidate_g
-            h = heuristic(neighbour, end)
-            F[neighbour] = G[neighbour] + h
 
-    # Out-of-bounds
-    return []
+def AStarWLayeredDict(Map: LayeredBarrierDict, start: Point, end: Point, allow_diagonal_movement: bool=True, movelist=[], min_dist=0, cache: Optional[PathCache]=None, stats: Optional[SearchStats]=None, bidirectional: bool=False, output: str="list", first: Optional[int]=None, any_angle: bool=False, costs: Optional[dict]=None, landmarks=None):
+    tilesize = Map.tilesize
 
+    start = (int(start[0]/tilesize), int(start[1]/tilesize))
+    end = (int(end[0]/tilesize), int(end[1]/tilesize))
 
-def SearchAroundWLayeredDict(Map: LayeredBarrierDict, start: Point, allow_diagonal_movement:bool=True, movelist=[]):
+    return _search(Map, start, end, allow_diagonal_movement, movelist, min_dist, cache, stats, bidirectional, output, first, any_angle, costs, landmarks)
+
+
+def SearchAroundWLayeredDict(Map: LayeredBarrierDict, start: Point, allow_diagonal_movement: bool=True, movelist=[], max_tiles: Optional[int]=100, max_steps: Optional[int]=None, distances: bool=False, stats: Optional[SearchStats]=None, costs: Optional[dict]=None) -> Region:
+    """
+    Tiles that can be reached from `start`, closest first.
+
+    :param max_tiles: Stop once this many tiles were found, None for no limit
+    :param max_steps: Only go this many steps away from `start`, None for no limit
+    :param bool distances: Also keep how many steps away every tile is
+    :param dict costs: Cost of stepping onto each kind of tile (default 1), see `AStarSearch`.
+        Tiles then come cheapest first and `max_steps` and distances count cost instead of steps
+    """
+    return _search_region(Map, start, allow_diagonal_movement, movelist, max_tiles, max_steps, distances, stats, costs)
+
+
+def _astar_many(walkable, starts, end, adjacent_squares, tilesize, min_dist, stats=None, output="list", first=None):
+    """
+    Answers every start with one search grown backwards from the goal.
+    """
+    if stats is not None:
+        stats.begin()
+
+    # Every walkable tile close enough to the end is a goal, like min_dist in `_astar`.
+    # With none, only starts already close enough get a path (just themselves)
+    reach = int(min_dist/tilesize)
+    goals = [end] if walkable(end[0], end[1]) else []
+    for x in range(end[0] - reach, end[0] + reach + 1):
+        for y in range(end[1] - reach, end[1] + reach + 1):
+            tile = (x, y)
+            if tile != end and get_dist(tile, end)*tilesize <= min_dist and walkable(x, y):
+                goals.append(tile)
+
+    # A start on a blocked tile (like a unit that is a barrier itself) can
+    # still step off it, like in `_astar`, so the tiles around it are searched for
+    targets = set()
+    blocked = set()
+    for start in starts:
+        if start in goals or walkable(start[0], start[1]):
+            targets.add(start)
+        else:
+            blocked.add(start)
+            for dx, dy in adjacent_squares:
+                if walkable(start[0] + dx, start[1] + dy):
+                    targets.add((start[0] + dx, start[1] + dy))
+
+    G, towards = _dijkstra(walkable, goals, adjacent_squares, targets, stats, backward=True)
+
+    paths = []
+    length = 0
+    for current in starts:
+        tiles = array("i")
+        if current in blocked:
+            tiles.append(current[0])
+            tiles.append(current[1])
+            if get_dist(current, end)*tilesize <= min_dist:
+                current = None  # Already close enough
+            else:
+                steps = []
+                for dx, dy in adjacent_squares:
+                    tile = (current[0] + dx, current[1] + dy)
+                    if tile in G:
+                        steps.append((G[tile] + move_cost(current, tile)*walkable(tile[0], tile[1]), tile))
+                if steps:
+                    current = min(steps)[1]
+                else:
+                    tiles = array("i")
+        if current in G:
+            tiles.append(current[0])
+            tiles.append(current[1])
+            while current in towards:
+                current = towards[current]
+                tiles.append(current[0])
+                tiles.append(current[1])
+        length += len(tiles)//2
+        paths.append(_format(tiles, tilesize, output, first))
+
+    if stats is not None:
+        stats.end(length)
+    return paths
+
+
+def AStarMany(Map: Union[LivingMap, ArrayMap], starts: List[Point], end: Point, allow_diagonal_movement: bool=True, movelist=[], min_dist=0, stats: Optional[SearchStats]=None, output: str="list", first: Optional[int]=None, costs: Optional[dict]=None):
+    """
+    Paths from every point in `starts` to `end`, in the same order as `starts`.
+
+    Costs one search for all of them instead of one per start.
+    Starts that cannot reach `end` get `[]`, all but `end` itself do if `end`
+    is blocked (and there is no `min_dist`).
+    Like in `AStarSearch`, a start may stand on a blocked tile.
+    `output`, `first` and `costs` work like in `AStarSearch`.
+    """
     tilesize = Map.tilesize
-    length = Map.length
-    height = Map.height
 
-    start = (int(start[0]/tilesize), int(start[1]/tilesize))
+    starts = [(round(start[0]/tilesize), round(start[1]/tilesize)) for start in starts]
+    end = (round(end[0]/tilesize), round(end[1]/tilesize))
 
-    graph = Map.barrier_dict
+    return _astar_many(
+        _walkable(Map, movelist, costs), starts, end, _adjacent(allow_diagonal_movement),
+        tilesize, min_dist, stats, output, first
+    )
 
-    closed_vertices = set()
-    open_vertices = set([start])
 
-    # what squares do we search
-    adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0),)
-    if allow_diagonal_movement:
-        adjacent_squares = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1),)
+def AStarManyWDict(Map: BarrierDict, starts: List[Point], end: Point, allow_diagonal_movement: bool=True, movelist=[], min_dist=0, stats: Optional[SearchStats]=None, output: str="list", first: Optional[int]=None, costs: Optional[dict]=None):
+    """
+    `AStarMany` for a `BarrierDict`
+    """
+    tilesize = Map.tilesize
 
-    count = 0
-    while len(open_vertices) > 0:
-        count += 1
-        if count > 100:
-            break
+    starts = [(int(start[0]/tilesize), int(start[1]/tilesize)) for start in starts]
+    end = (int(end[0]/tilesize), int(end[1]/tilesize))
 
-        #get first element in the set
-        for current in open_vertices:
-            break
-        open_vertices.remove(current)
-        closed_vertices.add(current)
+    return _astar_many(
+        _walkable(Map, movelist, costs), starts, end, _adjacent(allow_diagonal_movement),
+        tilesize, min_dist, stats, output, first
+    )
 
-        neighbours = []
-        for new_position in adjacent_squares: # Adjacent squares
-            neighbours.append((current[0] + new_position[0], current[1] + new_position[1]))
 
-        # Update scores for vertices near the current position
-        for neighbour in neighbours:
-            if neighbour[0] < 0 or neighbour[1] < 0 or neighbour[0] >= length or neighbour[1] >= height:
-                continue
-            elif not graph[neighbour[0]][neighbour[1]].layer in movelist:
-                continue
-            elif neighbour in closed_vertices:
-                continue
-            elif not neighbour in open_vertices:
-                open_vertices.add(neighbour)
+def AStarManyWLayeredDict(Map: LayeredBarrierDict, starts: List[Point], end: Point, allow_diagonal_movement: bool=True, movelist=[], min_dist=0, stats: Optional[SearchStats]=None, output: str="list", first: Optional[int]=None, costs: Optional[dict]=None):
+    """
+    `AStarMany` for a `LayeredBarrierDict`
+    """
+    tilesize = Map.tilesize
 
-    # Out-of-bounds
-    return count
+    starts = [(int(start[0]/tilesize), int(start[1]/tilesize)) for start in starts]
+    end = (int(end[0]/tilesize), int(end[1]/tilesize))
 
+    return _astar_many(
+        _walkable(Map, movelist, costs), starts, end, _adjacent(allow_diagonal_movement),
+        tilesize, min_dist, stats, output, first
+    )
@@ -12,6 +12,12 @@ __all__ = (
     "collapse",
 )
 
+
+# Neighbours of a tile, every module that walks the grid uses these
+STRAIGHT_SQUARES = ((0, -1), (0, 1), (-1, 0), (1, 0),)
+DIAGONAL_SQUARES = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1),)
+
+
 def heuristic(start: Tuple, goal: Tuple) -> float:
         """
         Gets the Heuristic of the 2 points
@@ -37,4 +43,4 @@ def get_dist(pos: number, pos2: number) -> float:
 
 
 def collapse(point: Point, tilesize: int) -> Point:
-    return point[0]/tilesize, point[1]/tilesize
+    return int(point[0]/tilesize), int(point[1]/tilesize)
@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import itertools
+import multiprocessing
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional
+from customtypes import Point
+from customMaps import ArrayMap, BarrierDict, LayeredBarrierDict, ChunkMap
+from pathfinding import (
+    AStarSearch, AStarWDict, AStarWLayeredDict,
+    SearchTilesAround, SearchAroundWDict, SearchAroundWLayeredDict,
+)
+
+
+__all__ = (
+    "PathServer",
+)
+
+
+def _functions(Map):
+    """
+    (A* function, region function) that fit the kind of map
+    """
+    if isinstance(Map, LayeredBarrierDict):
+        return AStarWLayeredDict, SearchAroundWLayeredDict
+    if isinstance(Map, (BarrierDict, ChunkMap)):
+        return AStarWDict, SearchAroundWDict
+    return AStarSearch, SearchTilesAround
+
+
+class _Moving:
+    """
+    Stands in for a moving barrier in what is sent to a worker.
+    The barrier itself drags its map along through its position's `listener`,
+    this blocks the same way (it is never in a movelist) and pickles in a few bytes.
+    """
+
+    __slots__ = ()
+
+    position = None  # Makes `LayeredBarrierDict.set_layers` take it for a moving barrier
+
+
+_MOVING = _Moving()
+
+
+def _portable(value):
+    """
+    `value` with moving barriers (anything with a position) swapped for `_MOVING`
+    """
+    if isinstance(value, list):
+        return [_MOVING if hasattr(layer, "position") else layer for layer in value]
+    return _MOVING if hasattr(value, "position") else value
+
+
+def _snapshot(Map):
+    """
+    Copy of the map that can be pickled, component indexes and cost grids are left behind
+    """
+    snapshot = copy.copy(Map)
+    snapshot.components = {}
+    snapshot.cost_grids = {}
+    # Maps opened with `load` keep their tiles in the mapped file
+    if isinstance(Map, ArrayMap) and isinstance(Map.tiles, memoryview):
+        snapshot.tiles = array(Map.typecode, Map.tiles)
+    elif isinstance(Map, LayeredBarrierDict):
+        if isinstance(Map.top_layers, memoryview):
+            snapshot.top_layers = bytearray(Map.top_layers)
+        snapshot.stacks = {index: [(number, _portable(layer)) for number, layer in stack]
+                           for index, stack in Map.stacks.items()}
+    elif isinstance(Map, ChunkMap):
+        # Every chunk goes along, the copy keeps them all in memory
+        snapshot.chunks = OrderedDict((key, Map._read(key)) for key in set(Map.chunks).union(Map.stored, Map.saved))
+        snapshot.saved = {}
+        snapshot.stored = {}
+        snapshot.store = None
+        snapshot.store_name = None
+        snapshot.max_chunks = None
+    if isinstance(Map, BarrierDict):
+        # The worker only learns where moving barriers are through deltas, it does not follow them
+        if not isinstance(Map, LayeredBarrierDict):
+            snapshot.barrier_dict = {x: {y: _portable(value) for y, value in column.items()}
+                                     for x, column in Map.barrier_dict.items()}
+        snapshot.moving_barriers = []
+        snapshot.placed = {}
+        snapshot.occupants = {}
+        snapshot.moved = {}
+    return snapshot
+
+
+def _read_tile(Map, tile):
+    x, y = tile
+    if isinstance(Map, LayeredBarrierDict):
+        return _portable(Map.layers(x, y))
+    if isinstance(Map, BarrierDict):
+        return _portable(Map.barrier_dict[x][y])
+    if isinstance(Map, ArrayMap):
+        return Map.tiles[x*Map.height + y]
+    if isinstance(Map, ChunkMap):
+        return Map._value(x, y)
+    return Map.graph[x][y]
+
+
+def _write_tile(Map, tile, value) -> None:
+    x, y = tile
+    if isinstance(Map, LayeredBarrierDict):
+        Map.set_layers(x, y, value)
+    elif isinstance(Map, BarrierDict):
+        Map.barrier_dict[x][y] = value
+        Map._changed(x, y)
+    else:
+        Map.change(x*Map.tilesize, y*Map.tilesize, value)
+
+
+def _delta(Map, changed) -> list:
+    """
+    (tile, value) for every tile in `changed`, what a worker needs to catch up
+    """
+    return [(tile, _read_tile(Map, tile)) for tile in changed]
+
+
+def _worker(tasks, results) -> None:
+    """
+    Runs in every worker process, answers queries against its own copy of the map
+    """
+    Map = None
+    functions = None
+    while True:
+        message = tasks.get()
+        if message is None:
+            return
+        kind = message[0]
+        if kind == "map":
+            Map = message[1]
+            functions = _functions(Map)
+        elif kind == "delta":
+            for tile, value in message[1]:
+                _write_tile(Map, tile, value)
+        else:
+            _, number, args, kwargs = message
+            try:
+                function = functions[0] if kind == "path" else functions[1]
+                results.put((number, function(Map, *args, **kwargs), None))
+            except Exception as error:
+                results.put((number, None, error))
+
+
+class PathServer:
+    """
+    Answers searches on a pool of worker processes, so they are not
+    held back by the GIL.
+
+    Every worker keeps its own copy of the map. Before a query is sent to a
+    worker, the tiles that changed since it last saw the map are sent along
+    (read from the map's change log), the whole map is only sent again when
+    the log does not reach back far enough.
+    Only edits that go through the map's change log are seen.
+
+    ... Example:
+        with PathServer(Map) as server:
+            future = server.path(start, end, movelist=[0])
+            path = future.result()
+    """
+
+    __slots__ = (
+        "Map",
+        "workers",
+        "queues",
+        "synced",
+        "pending",
+        "results",
+        "futures",
+        "numbers",
+        "lock",
+        "collector",
+        "closed"
+    )
+
+    def __init__(self, Map, processes: Optional[int] = None):
+        """
+        :param Map: Map to search on, any of the maps in `customMaps`
+        :param int processes: How many workers to start, one per CPU by default
+        """
+        self.Map = Map
+        self.results = multiprocessing.Queue()
+        self.futures = {}
+        self.numbers = itertools.count()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        snapshot = _snapshot(Map)
+        self.workers = []
+        self.queues = []
+        self.synced = []  # Map version each worker has seen
+        self.pending = []  # Queries each worker has not answered yet
+        for _ in range(processes or multiprocessing.cpu_count()):
+            queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=_worker, args=(queue, self.results), daemon=True)
+            worker.start()
+            queue.put(("map", snapshot))
+            self.workers.append(worker)
+            self.queues.append(queue)
+            self.synced.append(Map.version)
+            self.pending.append(0)
+
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+    def _collect(self) -> None:
+        """
+        Hands the answers from the workers to their futures
+        """
+        while True:
+            answer = self.results.get()
+            if answer is None:
+                return
+            number, result, error = answer
+            with self.lock:
+                future, worker = self.futures.pop(number)
+                self.pending[worker] -= 1
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _sync(self, worker: int) -> None:
+        Map = self.Map
+        if self.synced[worker] == Map.version:
+            return
+        changed = Map.changed_since(self.synced[worker])
+        if changed is None:
+            self.queues[worker].put(("map", _snapshot(Map)))
+        else:
+            self.queues[worker].put(("delta", _delta(Map, changed)))
+        self.synced[worker] = Map.version
+
+    def _submit(self, kind, args, kwargs) -> Future:
+        if self.closed:
+            raise RuntimeError("PathServer is closed")
+        future = Future()
+        with self.lock:
+            # The least busy worker gets it
+            worker = min(range(len(self.workers)), key=self.pending.__getitem__)
+            self._sync(worker)
+            number = next(self.numbers)
+            self.futures[number] = (future, worker)
+            self.pending[worker] += 1
+            self.queues[worker].put((kind, number, args, kwargs))
+        return future
+
+    def path(self, start: Point, end: Point, *args, **kwargs) -> Future:
+        """
+        A* on a worker, takes the same arguments as the A* function for this kind of map
+        (without `Map`, `cache` and `stats`, and `output="iter"` can not be sent back).
+        Returns a `concurrent.futures.Future`.
+        """
+        return self._submit("path", (start, end) + args, kwargs)
+
+    def region(self, start: Point, *args, **kwargs) -> Future:
+        """
+        `SearchTilesAround` (or the dict version) on a worker, returns a `concurrent.futures.Future`
+        """
+        return self._submit("region", (start,) + args, kwargs)
+
+    def path_async(self, start: Point, end: Point, *args, **kwargs):
+        """
+        Like `path`, but returns something that can be awaited in the running event loop
+        """
+        return asyncio.wrap_future(self.path(start, end, *args, **kwargs))
+
+    def region_async(self, start: Point, *args, **kwargs):
+        """
+        Like `region`, but returns something that can be awaited in the running event loop
+        """
+        return asyncio.wrap_future(self.region(start, *args, **kwargs))
+
+    def close(self) -> None:
+        """
+        Stops the workers once they answered everything already submitted
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for queue in self.queues:
+            queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.results.put(None)
+        self.collector.join()
+
+    def __enter__(self) -> PathServer:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from array import array
+from typing import Optional
+
+
+__all__ = (
+    "Region",
+)
+
+
+class Region:
+    """
+    Tiles reached by a region search, like `SearchTilesAround`.
+
+    Tiles are kept as one flat index each, `(x - left)*height + (y - bottom)`,
+    in the order they were reached, so closer tiles come first.
+    `steps` holds how many steps away from the start each tile is (what it
+    costs to get there, for a search with tile costs), it is None unless the
+    search was asked for distances.
+    """
+
+    __slots__ = (
+        "left",
+        "bottom",
+        "width",
+        "height",
+        "indices",
+        "steps",
+        "capped",
+        "lookup"
+    )
+
+    def __init__(self, bounds, indices: array, steps: Optional[array] = None, capped: bool=False):
+        """
+        :param bounds: (left, bottom, right, top) of the map, in tiles
+        :param array indices: Flat index of every tile in the region
+        :param array steps: Steps (or cost) from the start, one per index
+        :param bool capped: True if the tile budget ran out before the region did
+        """
+        self.left, self.bottom, right, top = bounds
+        self.width = right - self.left
+        self.height = top - self.bottom
+        self.indices = indices
+        self.steps = steps
+        self.capped = capped
+        self.lookup = None
+
+    def _index(self, tile):
+        x = int(tile[0]) - self.left
+        y = int(tile[1]) - self.bottom
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return -1
+        return x*self.height + y
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __iter__(self):
+        """
+        Yields the tiles as (x, y)
+        """
+        height = self.height
+        left = self.left
+        bottom = self.bottom
+        for index in self.indices:
+            yield (left + index // height, bottom + index % height)
+
+    def __contains__(self, tile) -> bool:
+        if self.lookup is None:
+            self.lookup = dict(zip(self.indices, range(len(self.indices))))
+        return self._index(tile) in self.lookup
+
+    def distance(self, tile) -> Optional[float]:
+        """
+        Steps from the start to `tile`, None if it was not reached
+        """
+        if self.steps is None:
+            raise ValueError("Region was searched without distances")
+        if self.lookup is None:
+            self.lookup = dict(zip(self.indices, range(len(self.indices))))
+        position = self.lookup.get(self._index(tile))
+        if position is None:
+            return None
+        return self.steps[position]
+
+    def mask(self) -> bytearray:
+        """
+        Bitmap of the region, one byte per tile in the same layout as `ArrayMap.tiles`
+        """
+        mask = bytearray(self.width*self.height)
+        for index in self.indices:
+            mask[index] = 1
+        return mask
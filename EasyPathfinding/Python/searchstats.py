@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from time import perf_counter
+from typing import Callable, Optional
+
+
+__all__ = (
+    "SearchStats",
+)
+
+
+class SearchStats:
+    """
+    Numbers about one search, pass it to a search function with `stats=`.
+
+    It is reset at the start of every search it is passed to.
+    `hook` is called with the stats every `every` expanded tiles,
+    while the search is still running.
+    """
+
+    __slots__ = (
+        "expanded",
+        "peak_open",
+        "capped",
+        "cached",
+        "seconds",
+        "path_length",
+        "hook",
+        "every",
+        "started"
+    )
+
+    def __init__(self, hook: Optional[Callable[[SearchStats], None]] = None, every: int=1000):
+        """
+        :param hook: Called as `hook(stats)` while searching
+        :param int every: How many expanded tiles between calls to `hook`
+        """
+        self.hook = hook
+        self.every = every
+        self.reset()
+
+    def reset(self) -> None:
+        self.expanded = 0  # Tiles taken off the open list and expanded
+        self.peak_open = 0  # Most entries the open list held at once
+        self.capped = False  # True if the search gave up on its iteration cap
+        self.cached = False  # True if the answer came from a `PathCache`
+        self.seconds = 0.0
+        self.path_length = 0
+        self.started = None
+
+    def begin(self) -> None:
+        self.reset()
+        self.started = perf_counter()
+
+    def expand(self, open_size: int) -> None:
+        self.expanded += 1
+        if open_size > self.peak_open:
+            self.peak_open = open_size
+        if self.hook is not None and self.expanded % self.every == 0:
+            self.hook(self)
+
+    def end(self, path_length: int=0) -> None:
+        self.seconds = perf_counter() - self.started
+        self.path_length = path_length
+
+    def __repr__(self) -> str:
+        return "SearchStats(expanded=%d, peak_open=%d, capped=%s, cached=%s, seconds=%.6f, path_length=%d)" % (
+            self.expanded, self.peak_open, self.capped, self.cached, self.seconds, self.path_length)
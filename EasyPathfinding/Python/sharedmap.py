@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import struct
+from collections import deque
+from multiprocessing import shared_memory, resource_tracker
+from typing import Union, Optional
+from customMaps import TrackedMap, LivingMap, ArrayMap
+from mapfile import write_map
+
+
+__all__ = (
+    "SharedMap",
+)
+
+
+# generation, length, height, tilesize
+HEADER = struct.Struct("<QIId")
+HEADER_SIZE = 32
+
+
+def _tile_bytes(Map):
+    """
+    The tiles of a map as one bytes-like object, in `ArrayMap` layout
+    """
+    if isinstance(Map, ArrayMap):
+        if Map.typecode != "B":
+            raise TypeError("Only ArrayMaps with typecode 'B' can be shared")
+        return memoryview(Map.tiles).cast("B")
+    if isinstance(Map, LivingMap):
+        return b"".join(bytes(column) for column in Map.graph)
+    raise TypeError("Only LivingMap and ArrayMap can be shared, not %s" % type(Map).__name__)
+
+
+class SharedMap(TrackedMap):
+    """
+    Tiles of a map in `multiprocessing.shared_memory`, one byte each,
+    so other processes can search it without a copy.
+
+    The block holds two tile buffers. `publish` writes the new tiles into the
+    one not in use, then bumps the generation in the header, and the
+    generation's lowest bit says which buffer is live. Readers never see a
+    half written snapshot, as long as a search is done before the publish
+    after the next one.
+
+    Search functions take it like any other map, `version` is the generation.
+    `close` releases the views `tiles` and `walkable` handed out, functions
+    from `walkable` stop working after it.
+
+    ... Example:
+        shared = SharedMap.create(Map)   # owner
+        reader = SharedMap.attach(shared.name)   # in another process
+        AStarSearch(reader, start, end, movelist=[0])
+    """
+
+    __slots__ = (
+        "memory",
+        "owner",
+        "views",
+        "length",
+        "height",
+        "tilesize",
+        "changes",
+        "components",
+        "cost_grids",
+        "__weakref__"
+    )
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        """
+        Use `SharedMap.create` or `SharedMap.attach` instead
+        """
+        self.memory = memory
+        self.owner = owner
+        self.views = [None, None]  # Read-only view of each buffer, shared by everything that reads it
+        _, self.length, self.height, tilesize = HEADER.unpack_from(memory.buf, 0)
+        # Kept as a double so any tilesize fits, whole ones come back as ints
+        self.tilesize = int(tilesize) if tilesize.is_integer() else tilesize
+        self.changes = deque()  # Tiles are not tracked, every new generation is a full change
+        self.components = {}
+        self.cost_grids = {}
+
+    @classmethod
+    def create(cls, Map: Union[LivingMap, ArrayMap], name: Optional[str] = None) -> SharedMap:
+        """
+        Makes a new shared block sized for `Map` and publishes it
+        """
+        size = Map.length * Map.height
+        memory = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + 2*size)
+        HEADER.pack_into(memory.buf, 0, 0, Map.length, Map.height, Map.tilesize)
+        shared = cls(memory, True)
+        shared.publish(Map)
+        return shared
+
+    @classmethod
+    def attach(cls, name: str) -> SharedMap:
+        """
+        Opens a block made by `create` (in any process) to read from
+        """
+        try:
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 the tracker would delete the block when this process exits
+            memory = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(memory._name, "shared_memory")
+        return cls(memory, False)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def version(self) -> int:
+        return HEADER.unpack_from(self.memory.buf, 0)[0]
+
+    def _buffer(self, generation: int) -> memoryview:
+        size = self.length * self.height
+        start = HEADER_SIZE + (generation & 1)*size
+        return self.memory.buf[start:start + size]
+
+    def publish(self, Map: Union[LivingMap, ArrayMap]) -> int:
+        """
+        Copies the tiles of `Map` in and makes them live, returns the new generation
+        """
+        if not self.owner:
+            raise PermissionError("Only the SharedMap made by `create` can publish")
+        if (Map.length, Map.height) != (self.length, self.height):
+            raise ValueError("Map is %dx%d, the shared block is %dx%d" % (
+                Map.length, Map.height, self.length, self.height))
+
+        generation = self.version + 1
+        self._buffer(generation)[:] = _tile_bytes(Map)
+        # The swap, readers pick the buffer from the generation
+        HEADER.pack_into(self.memory.buf, 0, generation, self.length, self.height, self.tilesize)
+        return generation
+
+    def tiles(self) -> memoryview:
+        """
+        Read-only view of the live tiles, index it with `x*height + y`.
+        The same view is handed out every time, `close` releases it.
+        """
+        side = self.version & 1
+        view = self.views[side]
+        if view is None:
+            view = self.views[side] = self._buffer(side).toreadonly()
+        return view
+
+    def walkable(self, movelist):
+        """
+        Returns a function that tells if the tile at (x, y) can be walked on,
+        it keeps reading the snapshot that was live when it was made
+        """
+        allowed = bytes(i in movelist for i in range(256))
+        tiles = self.tiles()
+        length = self.length
+        height = self.height
+        def check(x, y):
+            if x < 0 or y < 0 or x >= length or y >= height:
+                return False
+            return allowed[tiles[x*height + y]]
+        return check
+
+    def bounds(self):
+        """
+        (left, bottom, right, top) in tiles, right and top are exclusive
+        """
+        return (0, 0, self.length, self.height)
+
+    def _value(self, x, y):
+        return self.tiles()[x*self.height + y]
+
+    def _values(self):
+        return self.tiles()
+
+    def save(self, filename: str) -> None:
+        """
+        Writes the live tiles to a file `ArrayMap.load` opens
+        """
+        meta = {"kind": "ArrayMap", "tilesize": self.tilesize, "version": 0,
+                "length": self.length, "height": self.height, "components": [], "cost_grids": []}
+        write_map(filename, meta, {"tiles": self.tiles()})
+
+    def close(self) -> None:
+        """
+        Lets go of the block in this process. Views made from `tiles` by the
+        caller (slices, casts) have to be released first.
+        """
+        for view in self.views:
+            if view is not None:
+                view.release()
+        self.views = [None, None]
+        self.memory.close()
+
+    def unlink(self) -> None:
+        """
+        Frees the block for every process, only the owner should call it
+        """
+        # A reader in a child process shares our tracker and may have unregistered it
+        resource_tracker.register(self.memory._name, "shared_memory")
+        self.memory.unlink()
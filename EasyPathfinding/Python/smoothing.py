@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from array import array
+from typing import List
+from customtypes import Point
+
+
+__all__ = (
+    "line_of_sight",
+    "SmoothPath",
+)
+
+
+def line_of_sight(walkable, start, end) -> bool:
+    """
+    True if a straight line between the centres of two tiles only crosses walkable tiles.
+
+    Every tile the line touches is checked (a supercover line), so a line that
+    passes exactly through a corner needs both tiles beside the corner to be
+    walkable, it never clips a corner. `start` itself is not checked.
+    """
+    x, y = start
+    dx = abs(end[0] - x)
+    dy = abs(end[1] - y)
+    sx = 1 if end[0] > x else -1
+    sy = 1 if end[1] > y else -1
+
+    # Steps taken along each axis, the next tile boundary crossed decides the step
+    i = j = 0
+    while i < dx or j < dy:
+        decision = (2*i + 1)*dy - (2*j + 1)*dx
+        if decision == 0:
+            # Right through a corner
+            if not walkable(x + sx, y) or not walkable(x, y + sy):
+                return False
+            x += sx
+            y += sy
+            i += 1
+            j += 1
+        elif decision < 0:
+            x += sx
+            i += 1
+        else:
+            y += sy
+            j += 1
+        if not walkable(x, y):
+            return False
+    return True
+
+
+def _unclip(walkable, points) -> List:
+    """
+    Puts an extra tile in every diagonal step that cuts a blocked corner,
+    steps squeezed between two blocked corners are left as they are
+    """
+    fixed = [points[0]]
+    for (x, y), (nx, ny) in zip(points, points[1:]):
+        if x != nx and y != ny:
+            side_x = walkable(nx, y)
+            side_y = walkable(x, ny)
+            if side_x and not side_y:
+                fixed.append((nx, y))
+            elif side_y and not side_x:
+                fixed.append((x, ny))
+        fixed.append((nx, ny))
+    return fixed
+
+
+def _turns(points) -> List:
+    """
+    Only the ends and the points where a path changes direction,
+    the points in between can always be skipped
+    """
+    turns = [points[0]]
+    for previous, point, following in zip(points, points[1:], points[2:]):
+        if (point[0] - previous[0], point[1] - previous[1]) != (following[0] - point[0], following[1] - point[1]):
+            turns.append(point)
+    turns.append(points[-1])
+    return turns
+
+
+def _string_pull(walkable, tiles: array) -> array:
+    """
+    Drops every tile of a flat tile path that can be skipped in a straight line,
+    leaving only the turning points
+    """
+    points = [(tiles[i], tiles[i + 1]) for i in range(0, len(tiles), 2)]
+    if len(points) < 2:
+        return tiles
+    points = _turns(_unclip(walkable, points))
+
+    last = len(points) - 1
+    pulled = array("i", points[0])
+    i = 0
+    while i < last:
+        anchor = points[i]
+        # Gallop ahead while the line stays clear, then narrow down between the
+        # farthest clear turn (`seen`) and the first blocked one (`blocked`),
+        # so every anchor costs a few lines of sight instead of one per turn
+        seen = i + 1  # The next turn is reached along the path itself
+        blocked = None
+        reach = 2
+        while seen < last:
+            k = min(i + reach, last)
+            if not line_of_sight(walkable, anchor, points[k]):
+                blocked = k
+                break
+            seen = k
+            reach *= 2
+        if blocked is not None:
+            while blocked - seen > 1:
+                middle = (seen + blocked)//2
+                if line_of_sight(walkable, anchor, points[middle]):
+                    seen = middle
+                else:
+                    blocked = middle
+        i = seen
+        pulled.extend(points[i])
+    return pulled
+
+
+def SmoothPath(Map, path: List[Point], movelist=[]) -> List[Point]:
+    """
+    Any-angle version of a path from one of the searches: only the points where
+    it has to turn are kept, every straight leg in between stays on tiles in `movelist`.
+
+    The A* functions do the same with `any_angle=True`.
+    """
+    tilesize = Map.tilesize
+    tiles = array("i")
+    for x, y in path:
+        tiles.append(int(x // tilesize))
+        tiles.append(int(y // tilesize))
+    pulled = _string_pull(Map.walkable(movelist), tiles)
+    return [[pulled[i]*tilesize, pulled[i + 1]*tilesize] for i in range(0, len(pulled), 2)]
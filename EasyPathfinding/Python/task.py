@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from array import array
+from time import perf_counter
+from typing import Optional
+from customtypes import Point
+from pathfinding import _AStar, _adjacent, _format, _walkable, _to_tile, _estimate
+from pathcache import PathCache
+from searchstats import SearchStats
+
+
+__all__ = (
+    "AStarTask",
+)
+
+
+class AStarTask:
+    """
+    An A* search that can be run a bit at a time, so a long search
+    can be spread over several frames.
+
+    The open and closed lists are kept between calls to `step` and `run`.
+    Once `done` is True, `path` holds the same path `AStarSearch` (or
+    `AStarWDict` for dict maps) would have returned.
+    The map should not be changed while the task is running.
+    """
+
+    __slots__ = (
+        "Map",
+        "start",
+        "end",
+        "tilesize",
+        "search",
+        "cache",
+        "key",
+        "stats",
+        "output",
+        "first",
+        "done",
+        "path"
+    )
+
+    def __init__(self, Map, start: Point, end: Point, allow_diagonal_movement: bool=True, movelist=[], min_dist=0, cache: Optional[PathCache]=None, stats: Optional[SearchStats]=None, output: str="list", first: Optional[int]=None, costs: Optional[dict]=None, landmarks=None):
+        """
+        :param Map: Map to search on, any of the maps in `customMaps`
+        :param start: Start point in pixels
+        :param end: End point in pixels
+        :param cache: Answer from and store the path in this `PathCache`
+        :param stats: Filled in while the task runs, `seconds` only counts time spent in `step`
+        :param output: Format of `path`, like in `AStarSearch`
+        :param first: Only keep this many points of `path` from the start
+        :param dict costs: Cost of stepping onto each kind of tile, like in `AStarSearch`
+        :param landmarks: `LandmarkTable` to guide the search with, like in `AStarSearch`
+        """
+        tilesize = Map.tilesize
+        start = _to_tile(Map, start)
+        end = _to_tile(Map, end)
+
+        self.Map = Map
+        self.start = start
+        self.end = end
+        self.tilesize = tilesize
+        left, bottom, right, top = Map.bounds()
+        self.search = _AStar(
+            _walkable(Map, movelist, costs), start, end, _adjacent(allow_diagonal_movement),
+            (right - left)*(top - bottom),  # Every tile on the map
+            tilesize, min_dist, stats, _estimate(landmarks, min_dist, costs)
+        )
+        self.cache = cache
+        self.key = (start, end, frozenset(movelist), allow_diagonal_movement, min_dist)
+        if costs:
+            self.key += (frozenset(costs.items()),)
+        self.stats = stats
+        self.output = output
+        self.first = first
+        self.done = False
+        self.path = None
+
+        if stats is not None:
+            stats.reset()
+
+        if cache is not None:
+            tiles = cache.get(self.key)
+            if tiles is not None:
+                if stats is not None:
+                    stats.cached = True
+                self._finish(tiles, False)
+                return
+
+        index = Map.components.get((frozenset(movelist), allow_diagonal_movement)) if Map.components else None
+        if index is not None and min_dist <= 0 and not index.connected(start, end):
+            self._finish(array("i"), False)  # Different regions, no need to search
+
+    def _finish(self, tiles, store: bool=True) -> None:
+        self.done = True
+        self.path = _format(tiles, self.tilesize, self.output, self.first)
+        # The search state is not needed anymore
+        self.search = None
+        if store and self.cache is not None:
+            self.cache.put(self.key, tiles)
+        if self.stats is not None:
+            self.stats.path_length = len(tiles)//2
+
+    def step(self, max_expansions: int=100) -> bool:
+        """
+        Expands up to `max_expansions` tiles, returns `done`
+        """
+        if self.done:
+            return True
+
+        stats = self.stats
+        if stats is not None:
+            started = perf_counter()
+
+        tiles = self.search.run(max_expansions)
+
+        if stats is not None:
+            stats.seconds += perf_counter() - started
+        if tiles is not None:
+            self._finish(tiles)
+        return self.done
+
+    def run(self, time_budget_ms: float=1, batch: int=50) -> bool:
+        """
+        Steps until the search is done or `time_budget_ms` has passed, returns `done`
+
+        :param int batch: Tiles expanded between looks at the clock
+        """
+        deadline = perf_counter() + time_budget_ms/1000
+        while not self.step(batch):
+            if perf_counter() >= deadline:
+                return False
+        return True